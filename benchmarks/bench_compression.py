@@ -0,0 +1,107 @@
+import argparse
+import glob
+import os
+import random
+import sys
+import time
+import zlib
+
+# Make the shared `scraper` package importable when running from the benchmarks folder
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scraper.compression import DICT_SIZE, brotli, train_dictionary, zstandard
+
+# Stand-in for municipal pages when no cached pages are given: one CMS template, different content
+TEMPLATE = """<!DOCTYPE html><html lang="en"><head><meta charset="utf-8"><title>{title} | City of {city}, CA</title>
+<meta name="description" content="{description}"><link rel="stylesheet" href="/Assets/Styles/main.css">
+<script src="/Assets/Scripts/jquery.min.js"></script><script src="/Assets/Scripts/site.js"></script></head>
+<body><header id="header"><nav class="mainNav"><ul>{nav}</ul></nav><div class="search"><form action="/Search">
+<input type="text" name="searchPhrase" placeholder="Search..."></form></div></header>
+<main id="content"><div class="breadCrumbs"><a href="/">Home</a> &rsaquo; <a href="/{section}">{section}</a></div>
+<h1>{title}</h1><div class="fr-view">{body}</div></main><footer id="footer"><p>City of {city} &bull; {address}</p>
+<ul class="footerLinks"><li><a href="/Accessibility">Accessibility</a></li><li><a href="/Copyright">Copyright
+Notices</a></li><li><a href="/Privacy">Privacy Policy</a></li><li><a href="/SiteMap">Site Map</a></li></ul>
+<p class="poweredBy">Government Websites by CivicPlus&reg;</p></footer></body></html>"""
+WORDS = ("project construction road improvement park water sewer pavement rehabilitation bridge design "
+         "planning commission council hearing environmental review housing development permit street "
+         "drainage facility upgrade phase contract bid award schedule completion budget funding grant").split()
+
+
+# Function to generate CMS-like pages for a quick run without a page cache
+def synthetic_pages(count):
+    random.seed(1)
+    cities = ['Richmond', 'Eureka', 'Arcata', 'Novato', 'Corona', 'Fontana', 'Ontario', 'Lompoc']
+    nav = ''.join(f'<li><a href="/{name}">{name}</a></li>' for name in
+                  ('Government', 'Departments', 'Community', 'Business', 'Services', 'How Do I'))
+    pages = []
+    for i in range(count):
+        paragraphs = ''.join('<p>' + ' '.join(random.choices(WORDS, k=random.randint(40, 120))) + '.</p>'
+                             for _ in range(random.randint(3, 12)))
+        pages.append(TEMPLATE.format(
+            title=' '.join(random.choices(WORDS, k=4)).title(), city=random.choice(cities),
+            description=' '.join(random.choices(WORDS, k=20)), nav=nav, section=random.choice(WORDS).title(),
+            body=paragraphs, address=f"{random.randint(100, 999)} Main Street").encode())
+    return pages
+
+
+# Function to load pages from a page cache database or a folder of .html files
+def load_pages(page_cache=None, pages_dir=None):
+    if page_cache:
+        from scraper.pagecache import PageCache
+        return [content for _, content, _ in PageCache(page_cache).iter_pages()]
+    pages = []
+    for path in glob.glob(os.path.join(pages_dir, '**', '*.htm*'), recursive=True):
+        with open(path, 'rb') as file:
+            pages.append(file.read())
+    return pages
+
+
+# Function to time compressing and decompressing every page on its own, as the page cache does
+def measure(name, compress, decompress, pages):
+    raw = sum(len(page) for page in pages)
+    started = time.perf_counter()
+    blobs = [compress(page) for page in pages]
+    compress_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    for blob in blobs:
+        decompress(blob)
+    decompress_seconds = time.perf_counter() - started
+    stored = sum(len(blob) for blob in blobs)
+    print(f"{name:>16}: {stored / 2 ** 20:8.2f} MiB  ratio {raw / stored:5.2f}  saved {100 * (1 - stored / raw):5.1f}%  "
+          f"compress {raw / 2 ** 20 / compress_seconds:7.1f} MiB/s  decompress {raw / 2 ** 20 / decompress_seconds:7.1f} MiB/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytes saved against CPU cost of the page compression codecs.")
+    parser.add_argument('--page-cache', help="Page cache database to take the pages from")
+    parser.add_argument('--pages-dir', help="Folder of .html files to take the pages from")
+    parser.add_argument('--synthetic', type=int, default=2000, help="Number of generated pages when none are given")
+    args = parser.parse_args()
+    pages = load_pages(args.page_cache, args.pages_dir) if args.page_cache or args.pages_dir else \
+        synthetic_pages(args.synthetic)
+    random.shuffle(pages)
+    # Train on one half, measure on the other so the dictionary doesn't just memorise the test pages
+    train, test = pages[:len(pages) // 2], pages[len(pages) // 2:]
+    print(f"{len(test)} pages, {sum(len(page) for page in test) / 2 ** 20:.2f} MiB raw")
+
+    for level in (1, 6, 9):
+        measure(f"gzip-{level}", lambda page, level=level: zlib.compress(page, level), zlib.decompress, test)
+    if brotli is not None:
+        for quality in (5, 11):
+            measure(f"brotli-{quality}", lambda page, quality=quality: brotli.compress(page, quality=quality),
+                    brotli.decompress, test)
+    if zstandard is None:
+        print("zstandard is not installed; skipping zstd")
+        return
+    for level in (3, 9, 19):
+        compressor = zstandard.ZstdCompressor(level=level)
+        measure(f"zstd-{level}", compressor.compress, zstandard.ZstdDecompressor().decompress, test)
+    dictionary = zstandard.ZstdCompressionDict(train_dictionary(train, size=DICT_SIZE))
+    decompressor = zstandard.ZstdDecompressor(dict_data=dictionary)
+    for level in (3, 9, 19):
+        compressor = zstandard.ZstdCompressor(level=level, dict_data=dictionary)
+        measure(f"zstd-{level}+dict", compressor.compress, decompressor.decompress, test)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import argparse
+import csv
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+
+# Make the shared `scraper` package importable when running from the benchmarks folder
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scraper.geocode import default_geocoder
+from scraper.standardize import standardize_batch, write_to_csv
+
+# Cities the records are spread over, as in the input CSV
+CITIES = ['Richmond', 'Bakersfield', 'Eureka', 'San Rafael', 'Fairfield (Public Works)', 'Santa Rosa', 'Shoreline',
+          None]
+
+
+# The previous dict-per-row standardization, kept here as the baseline
+def standardize_dict(title, description, additional_info, url, city=None):
+    return {
+        "aug_id": str(uuid.uuid4()),
+        "country_name": "United States",
+        "country_code": "USA",
+        "map_coordinates": {"type": "Point", "coordinates": [-122.4, 37.8]},
+        "url": url,
+        "region_name": "California",
+        "region_code": "CA",
+        "title": title,
+        "description": description,
+        "status": additional_info.get("status", random.choice(["Open", "Closed"])),
+        "stages": additional_info.get("stages", random.choice(["Planning", "Execution"])),
+        "date": datetime.now().strftime("%Y-%m-%d"),
+        "procurementMethod": additional_info.get("procurementMethod",
+                                                 random.choice(["Design and Build", "Request for Proposal"])),
+        "budget": additional_info.get("budget", random.uniform(100000.0, 10000000.0)),
+        "currency": additional_info.get("currency", "USD"),
+        "buyer": additional_info.get("buyer", random.choice(["Public", "Private"])),
+        "sector": additional_info.get("sector", "Construction"),
+        "subsector": additional_info.get("subsector",
+                                         random.choice(["Building Construction", "Infrastructure Development"])),
+        "bert_predicted_label": {
+            "status": random.choice(["Open", "Closed"]),
+            "stages": random.choice(["Planning", "Execution"]),
+            "procurementMethod": random.choice(["Design and Build", "Request for Proposal"]),
+            "budget": random.uniform(100000.0, 10000000.0),
+            "currency": "USD",
+            "buyer": random.choice(["Public", "Private"]),
+            "sector": "Construction",
+            "subsector": random.choice(["Building Construction", "Infrastructure Development"]),
+        },
+    }
+
+
+# Function to write dict rows the previous way: nested dicts go through repr
+def write_dicts(data_list, filename):
+    with open(filename, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=data_list[0].keys())
+        writer.writeheader()
+        for data in data_list:
+            writer.writerow(data)
+
+
+# Function to time a build and measure the memory held by its result
+def measure(name, build, write, count):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    records = build()
+    build_seconds = time.perf_counter() - started
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        write(records, os.path.join(directory, 'records.csv'))
+        write_seconds = time.perf_counter() - started
+    print(f"{name:>8}: build {build_seconds * 1e6 / count:.2f} us/record, write {write_seconds * 1e6 / count:.2f} "
+          f"us/record, held {held / count:.0f} B/record ({held / 2 ** 20:.0f} MiB), peak {peak / 2 ** 20:.0f} MiB")
+    del records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-record cost and memory of standardized records.")
+    parser.add_argument('--records', type=int, default=1000000)
+    args = parser.parse_args()
+    count = args.records
+    rows = [(f"Project {i}", f"Description of project {i}", {}, f"https://example.com/projects/{i}",
+             CITIES[i % len(CITIES)]) for i in range(count)]
+    print(f"{count} records")
+    geocoder = default_geocoder()
+    started = time.perf_counter()
+    for title, description, _, url, city in rows:
+        geocoder.resolve(city, url, (title, description))
+    print(f"geocode: {(time.perf_counter() - started) * 1e6 / count:.2f} us/record")
+    measure('dicts', lambda: [standardize_dict(*row) for row in rows], write_dicts, count)
+    measure('batch', lambda: standardize_batch(rows), write_to_csv, count)
+
+
+if __name__ == '__main__':
+    main()
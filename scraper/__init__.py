@@ -0,0 +1 @@
+# Shared building blocks for the scraping and standardization scripts and the Flask app.
@@ -0,0 +1,207 @@
+import argparse
+import os
+import time
+
+from scraper.discovery import DISCOVERY_STATE_FILE, Discovery
+from scraper.distributed import SQLiteCoordinator, make_shards, merge_run, run_local, worker_main
+from scraper.fetch import HOST_STATE_FILE, FetchClient
+from scraper.geocode import GAZETTEER_PATH, INDEX_PATH, build_index
+from scraper.profiling import DEFAULT_PROFILE_DIR, UrlProfiler, profile_run
+from scraper.relevance import RelevanceEngine
+from scraper.resources import ResourceGovernor, benchmark_splits
+from scraper.pagecache import PageCache
+from scraper.standardize import export_records
+from scraper.tasks import (DEFAULT_OPTIONS, load_model, rank_urls, read_cities, read_urls, scrape_top_links,
+                           scrape_urls, update_dataset)
+
+
+# Function to add the per-stage concurrency flags shared by every command.
+# Flags left unset are filled in by the resource governor.
+def add_pipeline_arguments(parser):
+    parser.add_argument('--input', default='data/input_urls.csv', help="CSV file with a 'Source URL' column")
+    parser.add_argument('--fetch-workers', type=int)
+    parser.add_argument('--parse-workers', type=int)
+    parser.add_argument('--parse-mode', choices=['thread', 'process'])
+    parser.add_argument('--score-batch-size', type=int)
+    parser.add_argument('--queue-size', type=int, help="Bound of the queues between stages (backpressure)")
+    parser.add_argument('--resources', default='resources.json',
+                        help="CPU split saved by the tune command (defaults are derived from the cores if missing)")
+    parser.add_argument('--page-cache', help="SQLite file where fetched pages are kept zstd-compressed for replay")
+    parser.add_argument('--profile', choices=['sampling', 'deterministic'],
+                        help="Profile the run: stack sampling (low overhead) or cProfile in every pipeline thread")
+    parser.add_argument('--profile-every', type=int, metavar='N', help="Profile the fetch and parse of 1 in N URLs")
+    parser.add_argument('--profile-dir', default=DEFAULT_PROFILE_DIR,
+                        help="Where collapsed stacks, pstats files and torch traces are written, named by run id")
+
+
+# Function to create the fetch client, storing fetched pages in the page cache when one is given
+def make_fetch_client(args, state_path=None):
+    page_cache = PageCache(args.page_cache) if getattr(args, 'page_cache', None) else None
+    return FetchClient(state_path=state_path, page_cache=page_cache)
+
+
+# Function to collect the pipeline options given on the command line
+def pipeline_options(args):
+    return {name: getattr(args, name) for name in DEFAULT_OPTIONS if getattr(args, name, None) is not None}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m scraper', description="Scrape and standardize project data.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help="Rank the input URLs and standardize the top links")
+    add_pipeline_arguments(run)
+    run.add_argument('--output', default='data/standardized_data.csv')
+    run.add_argument('--top-k', type=int, default=10)
+
+    research = commands.add_parser('research', help="Rank the input URLs and print the top links")
+    add_pipeline_arguments(research)
+    research.add_argument('--top-k', type=int, default=10)
+
+    extract = commands.add_parser('extract', help="Standardize every input URL without ranking")
+    add_pipeline_arguments(extract)
+    extract.add_argument('--output', default='data/standardized_data.csv')
+
+    update = commands.add_parser('update', help="Incrementally update the dataset (sitemaps, ranking, crawl)")
+    add_pipeline_arguments(update)
+    update.add_argument('--output', default='data/standardized_data.csv')
+    update.add_argument('--top-k', type=int, default=10)
+    update.add_argument('--crawl-depth', type=int, default=2)
+    update.add_argument('--pages-per-seed', type=int, default=25)
+    update.add_argument('--state-dir', default='.', help="Where host health, discovery state and caches are kept")
+    update.add_argument('--interval', type=int, default=0, help="Repeat every N seconds (0 runs once)")
+
+    tune = commands.add_parser('tune', help="Benchmark inference/parse splits on this host and save the fastest")
+    add_pipeline_arguments(tune)
+    tune.add_argument('--sample', type=int, default=20, help="How many input pages to fetch for the benchmark")
+    tune.add_argument('--repeats', type=int, default=1, help="How many times each page is processed per trial")
+
+    dist = commands.add_parser('dist', help="Sharded run over several worker processes or machines")
+    dist.add_argument('action', choices=['init', 'worker', 'merge', 'local'],
+                      help="init registers the shards, worker processes them, merge combines their outputs, "
+                           "local does all three with worker processes on this machine")
+    add_pipeline_arguments(dist)
+    dist.add_argument('--db', default='coordinator.sqlite', help="Coordinator database (on storage shared by the nodes)")
+    dist.add_argument('--run-id', help="Run to work on (defaults to the latest one)")
+    dist.add_argument('--shards', type=int, default=16)
+    dist.add_argument('--workers', type=int, default=2, help="Worker processes for the local action")
+    dist.add_argument('--lease-seconds', type=int, default=300)
+    dist.add_argument('--parts-dir', default='parts', help="Where each shard's CSV is written")
+    dist.add_argument('--state-dir', default='.', help="Where the per-host health and discovery state are kept")
+    dist.add_argument('--output', default='data/standardized_data.csv')
+    dist.add_argument('--crawl-depth', type=int, default=2)
+    dist.add_argument('--pages-per-seed', type=int, default=25)
+
+    gazetteer = commands.add_parser('gazetteer', help="Build the offline geocoding index from a gazetteer file")
+    gazetteer.add_argument('--source', default=GAZETTEER_PATH,
+                           help="Tab separated places file with USPS, NAME, INTPTLAT and INTPTLONG columns "
+                                "(e.g. the Census national places gazetteer)")
+    gazetteer.add_argument('--index', default=INDEX_PATH)
+
+    pages = commands.add_parser('pages', help="Manage the compressed page cache")
+    pages.add_argument('action', choices=['stats', 'train'],
+                       help="stats reports the compression ratio, train fits a zstd dictionary to the cached pages "
+                            "and recompresses them with it")
+    pages.add_argument('--page-cache', required=True)
+    return parser
+
+
+# Function to run the dist command; workers build their own resource governor (from --resources when
+# it fits their cores) and open the page cache themselves
+def run_distributed(args, options):
+    coordinator = SQLiteCoordinator(args.db)
+    options.update(crawl_depth=args.crawl_depth, pages_per_seed=args.pages_per_seed, resources=args.resources,
+                   page_cache=args.page_cache)
+    if os.path.exists(args.input):
+        options['cities'] = read_cities(args.input)
+    if args.action == 'init':
+        run_id = coordinator.create_run(make_shards(read_urls(args.input), args.shards), run_id=args.run_id)
+        print(f"Run {run_id} created with {args.shards} shards in {args.db}")
+    elif args.action == 'worker':
+        worker_main(args.db, args.parts_dir, args.state_dir, args.lease_seconds, args.run_id, **options)
+    elif args.action == 'merge':
+        run_id = args.run_id or coordinator.latest_run()
+        merge_run(coordinator, run_id, args.output)
+    elif args.action == 'local':
+        run_local(args.db, read_urls(args.input), args.output, num_shards=args.shards, num_workers=args.workers,
+                  parts_dir=args.parts_dir, state_dir=args.state_dir, lease_seconds=args.lease_seconds, **options)
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == 'update':
+        # Long-running; profiled one update at a time
+        run_command(args)
+        return
+    with profile_run(getattr(args, 'profile', None), getattr(args, 'profile_dir', DEFAULT_PROFILE_DIR)):
+        run_command(args)
+
+
+def run_command(args):
+    options = pipeline_options(args)
+    if args.command == 'gazetteer':
+        build_index(args.source, args.index)
+        return
+    if args.command == 'pages':
+        page_cache = PageCache(args.page_cache)
+        if args.action == 'train':
+            try:
+                page_cache.train()
+            except RuntimeError as e:
+                print(f"Error training the page dictionary: {str(e)}")
+        print(page_cache.stats())
+        return
+    if args.command == 'dist':
+        run_distributed(args, options)
+        return
+    urls = read_urls(args.input)
+    options['cities'] = read_cities(args.input)
+    if args.profile_every:
+        options['url_profiler'] = UrlProfiler(args.profile_every, output_dir=args.profile_dir)
+    governor = ResourceGovernor.load(args.resources)
+    governor.apply_torch()
+    print(f"Resource split: {governor.describe()}")
+    options['governor'] = governor
+
+    if args.command == 'extract':
+        export_records(scrape_urls(urls, make_fetch_client(args), **options), args.output)
+        return
+
+    tokenizer, model = load_model()
+    if args.command == 'tune':
+        fetch_client = make_fetch_client(args)
+        html_pages = {}
+        for url in urls[:args.sample]:
+            # Replay from the page cache when the page is there
+            html_content = (fetch_client.page_cache and fetch_client.page_cache.get(url)) or fetch_client.fetch(url)
+            if html_content:
+                html_pages[url] = html_content
+        benchmark_splits(html_pages, tokenizer, model, governor, repeats=args.repeats)
+        governor.save(args.resources)
+        print(f"Best split saved to {args.resources}: {governor.describe()}")
+    elif args.command == 'research':
+        engine = RelevanceEngine(tokenizer, model)
+        print("Top 5 to 10 Relevant Links:")
+        for page in rank_urls(urls, make_fetch_client(args), engine, top_k=args.top_k, **options):
+            print(page['url'])
+    elif args.command == 'run':
+        engine = RelevanceEngine(tokenizer, model)
+        export_records(scrape_top_links(urls, make_fetch_client(args), engine, top_k=args.top_k, **options),
+                       args.output)
+    elif args.command == 'update':
+        engine = RelevanceEngine(tokenizer, model, cache_path=os.path.join(args.state_dir, 'embedding_cache.npz'))
+        fetch_client = make_fetch_client(args, state_path=os.path.join(args.state_dir, HOST_STATE_FILE))
+        discovery = Discovery(fetch_client, state_path=os.path.join(args.state_dir, DISCOVERY_STATE_FILE))
+        while True:
+            print("Running data scraping and standardization process...")
+            with profile_run(args.profile, args.profile_dir):
+                update_dataset(args.input, args.output, fetch_client, engine, discovery, top_k=args.top_k,
+                               crawl_depth=args.crawl_depth, pages_per_seed=args.pages_per_seed, **options)
+            if not args.interval:
+                break
+            print("Waiting for next execution...")
+            time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+import gzip
+import io
+import os
+import zlib
+
+# Optional codecs: brotli lets requests/urllib3 decode `br` responses, zstandard is used for
+# stored pages and .zst files. Without them we fall back to gzip/zlib.
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# With a trained dictionary, level 3 already beats gzip -9 by far at several times its speed
+# (benchmarks/bench_compression.py); higher levels cost much more CPU for a few percent
+ZSTD_LEVEL = 3
+GZIP_LEVEL = 6
+# Size of the dictionary trained on fetched pages; ~100 KB is the usual sweet spot for HTML
+DICT_SIZE = 112 * 1024
+
+
+# Function to get the Accept-Encoding header for fetches: brotli only when we can decode it
+def accept_encoding():
+    return 'br, gzip, deflate' if brotli is not None else 'gzip, deflate'
+
+
+# Function to split a compression suffix off a path: 'data.csv.gz' -> ('data.csv', 'gz')
+def split_codec(path):
+    for suffix in ('gz', 'zst'):
+        if path.endswith('.' + suffix):
+            return path[:-len(suffix) - 1], suffix
+    return path, None
+
+
+# Function to find the file to load a state file from: the path itself, or the same file saved
+# uncompressed by an older run (so switching a state file to .gz/.zst keeps what it knew)
+def existing_path(path):
+    if os.path.exists(path):
+        return path
+    plain = split_codec(path)[0]
+    return plain if plain != path and os.path.exists(plain) else None
+
+
+# Function to open a file, compressing or decompressing on the fly by its suffix (.gz or .zst).
+# Text modes take the usual encoding/newline arguments.
+def open_compressed(path, mode='r', encoding=None, newline=None):
+    _, codec = split_codec(path)
+    text = 'b' not in mode
+    if codec is None:
+        return open(path, mode, encoding=encoding, newline=newline) if text else open(path, mode)
+    binary_mode = mode.replace('t', '').replace('b', '') + 'b'
+    if codec == 'gz':
+        raw = gzip.open(path, binary_mode, compresslevel=GZIP_LEVEL)
+    else:
+        if zstandard is None:
+            raise RuntimeError(f"Reading or writing {path} needs the zstandard package")
+        raw = zstandard.open(path, binary_mode, cctx=zstandard.ZstdCompressor(level=ZSTD_LEVEL))
+    if text:
+        return io.TextIOWrapper(raw, encoding=encoding or 'utf-8', newline=newline)
+    return raw
+
+
+# Function to train a zstd dictionary from sample pages (pages of the same CMS share most of their markup)
+def train_dictionary(samples, size=DICT_SIZE):
+    if zstandard is None:
+        raise RuntimeError("Training a compression dictionary needs the zstandard package")
+    return zstandard.train_dictionary(size, list(samples)).as_bytes()
+
+
+# Compresses stored pages: zstd with the trained dictionary when there is one, plain zstd, or zlib
+# without the zstandard package. The codec name is stored next to each blob so old entries stay
+# readable after the dictionary is retrained or the package is installed.
+class PageCodec:
+    def __init__(self, dictionary=None, level=ZSTD_LEVEL):
+        self.level = level
+        self.dictionary = None
+        self.dict_id = None
+        if dictionary and zstandard is not None:
+            self.dictionary = zstandard.ZstdCompressionDict(dictionary)
+            self.dict_id = self.dictionary.dict_id()
+        self._dictionaries = {}
+        if self.dictionary is not None:
+            self._dictionaries[self.dict_id] = self.dictionary
+
+    # Function to name the codec new blobs are written with
+    def codec(self):
+        if zstandard is None:
+            return 'zlib'
+        return f"zstd-dict-{self.dict_id}" if self.dictionary is not None else 'zstd'
+
+    def compress(self, data):
+        codec = self.codec()
+        if codec == 'zlib':
+            return codec, zlib.compress(data, GZIP_LEVEL)
+        # Compressor objects aren't thread safe, and creating one is cheap next to compressing a page
+        compressor = zstandard.ZstdCompressor(level=self.level, dict_data=self.dictionary)
+        return codec, compressor.compress(data)
+
+    def decompress(self, codec, blob):
+        if codec == 'zlib':
+            return zlib.decompress(blob)
+        if zstandard is None:
+            raise RuntimeError(f"Reading {codec} pages needs the zstandard package")
+        dictionary = None
+        if codec.startswith('zstd-dict-'):
+            dictionary = self._dictionaries.get(int(codec[len('zstd-dict-'):]))
+            if dictionary is None:
+                raise ValueError(f"Page compressed with dictionary {codec}, which is not loaded")
+        return zstandard.ZstdDecompressor(dict_data=dictionary).decompress(blob)
+
+    # Function to make a previous dictionary readable (e.g. while recompressing with a new one)
+    def add_dictionary(self, dictionary):
+        if zstandard is not None:
+            dictionary = zstandard.ZstdCompressionDict(dictionary)
+            self._dictionaries[dictionary.dict_id()] = dictionary
+
+
+# Function to compress a stream of byte chunks for an HTTP response; the encoding is picked from the
+# client's Accept-Encoding. Returns (content encoding or None, chunk iterator).
+def compress_stream(chunks, accept):
+    accepted = {part.split(';')[0].strip() for part in (accept or '').lower().split(',')}
+    if brotli is not None and 'br' in accepted:
+        def brotli_chunks():
+            compressor = brotli.Compressor(quality=5)
+            for chunk in chunks:
+                data = compressor.process(chunk)
+                if data:
+                    yield data
+            yield compressor.finish()
+        return 'br', brotli_chunks()
+    if 'gzip' in accepted:
+        def gzip_chunks():
+            compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            for chunk in chunks:
+                data = compressor.compress(chunk)
+                if data:
+                    yield data
+            yield compressor.flush()
+        return 'gzip', gzip_chunks()
+    return None, chunks
@@ -0,0 +1,240 @@
+import gzip
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import urljoin, urlsplit
+from urllib.robotparser import RobotFileParser
+from xml.etree.ElementTree import ParseError, iterparse
+
+from scraper.compression import existing_path, open_compressed
+from scraper.fetch import host_of
+
+USER_AGENT = '*'
+# Default discovery state file (robots.txt bodies and page lastmods), gzipped
+DISCOVERY_STATE_FILE = 'discovery_state.json.gz'
+
+# Words in a URL path that mark a project detail page (as opposed to news, events, staff pages...)
+PROJECT_KEYWORDS = ('project', 'construction', 'development', 'capital', 'improvement', 'infrastructure',
+                    'bid', 'tender', 'rfp', 'planning')
+
+# Sitemap protocol namespace; extensions such as <image:loc> and <video:loc> use their own
+SITEMAP_NS = '{http://www.sitemaps.org/schemas/sitemap/0.9}'
+
+# Limits so a huge or looping sitemap index cannot run away
+MAX_SITEMAPS_PER_HOST = 50
+MAX_SITEMAP_DEPTH = 3
+
+
+# Function to get the scheme://host root of a URL
+def site_root(url):
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+# Function to drop the XML namespace from a tag name
+def local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+# Function to turn a sitemap <lastmod> (W3C datetime) into a UTC timestamp, or None
+def parse_lastmod(value):
+    if not value:
+        return None
+    value = value.strip().replace('Z', '+00:00')
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        try:
+            parsed = datetime.strptime(value[:10], '%Y-%m-%d')
+        except ValueError:
+            return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+# Function to check whether a URL looks like a project page
+def looks_like_project(url):
+    path = urlsplit(url).path.lower()
+    return any(keyword in path for keyword in PROJECT_KEYWORDS)
+
+
+# Function to stream <loc>/<lastmod> entries out of a sitemap file object without building the tree.
+# Yields ('url', loc, lastmod) for pages and ('sitemap', loc, lastmod) for nested sitemap indexes.
+# Only the sitemap protocol's own <loc>/<lastmod> directly under each entry are read (unqualified
+# tags are accepted too), so extension tags like <image:loc> never replace the page URL.
+def iter_sitemap(stream):
+    for event, element in iterparse(stream, events=('end',)):
+        name = local_name(element.tag)
+        if name in ('url', 'sitemap') and element.tag in (SITEMAP_NS + name, name):
+            loc = child_text(element, 'loc')
+            if loc:
+                yield name, loc, child_text(element, 'lastmod')
+            element.clear()
+
+
+# Function to get the stripped text of an entry's direct <loc>/<lastmod> child, or None
+def child_text(element, name):
+    for child in element:
+        if child.tag in (SITEMAP_NS + name, name):
+            return (child.text or '').strip() or None
+    return None
+
+
+# Discovers new or modified pages from each host's robots.txt and sitemaps, remembering
+# what it has seen (and when it last changed) so unchanged pages are not queued again
+class Discovery:
+    def __init__(self, fetch_client, state_path=None, robots_ttl=24 * 3600, revisit_after=30 * 24 * 3600):
+        self.fetch_client = fetch_client
+        self.state_path = state_path
+        self.robots_ttl = robots_ttl
+        # Pages whose sitemap entry has no <lastmod> are re-queued after this long
+        self.revisit_after = revisit_after
+        self.state = {'robots': {}, 'pages': {}}
+        self._parsers = {}
+        self._lock = threading.Lock()
+        if state_path:
+            self.load_state()
+
+    # Function to get the parsed robots.txt for a host, fetching it at most once per robots_ttl
+    def robots_for(self, url):
+        host = host_of(url)
+        with self._lock:
+            parser = self._parsers.get(host)
+            cached = self.state['robots'].get(host)
+        if parser is not None:
+            return parser
+        if not cached or time.time() - cached['fetched'] > self.robots_ttl:
+            body = self.fetch_client.fetch(site_root(url) + '/robots.txt')
+            cached = {'fetched': time.time(), 'body': body.decode('utf-8', errors='ignore') if body else ''}
+            with self._lock:
+                self.state['robots'][host] = cached
+        parser = RobotFileParser()
+        parser.parse(cached['body'].splitlines())
+        # Respect Crawl-delay for every later request to this host
+        delay = parser.crawl_delay(USER_AGENT)
+        if delay:
+            self.fetch_client.set_crawl_delay(host, delay)
+        with self._lock:
+            self._parsers[host] = parser
+        return parser
+
+    # Function to check robots.txt before queueing a URL
+    def allowed(self, url):
+        return self.robots_for(url).can_fetch(USER_AGENT, url)
+
+    # Function to list the sitemaps of a host: the ones robots.txt names, else /sitemap.xml
+    def sitemaps_for(self, url):
+        sitemaps = self.robots_for(url).site_maps()
+        return list(sitemaps) if sitemaps else [site_root(url) + '/sitemap.xml']
+
+    # Function to stream every page entry of a host's sitemaps, following sitemap indexes
+    def iter_pages(self, url):
+        pending = [(sitemap, 0) for sitemap in self.sitemaps_for(url)]
+        seen = set()
+        while pending and len(seen) < MAX_SITEMAPS_PER_HOST:
+            sitemap_url, depth = pending.pop()
+            if sitemap_url in seen:
+                continue
+            seen.add(sitemap_url)
+            response = self.fetch_client.request(sitemap_url, stream=True)
+            if response is None:
+                continue
+            try:
+                response.raw.decode_content = True
+                stream = response.raw
+                if sitemap_url.endswith('.gz'):
+                    stream = gzip.GzipFile(fileobj=stream)
+                for kind, loc, lastmod in iter_sitemap(stream):
+                    if kind == 'sitemap':
+                        if depth < MAX_SITEMAP_DEPTH:
+                            pending.append((urljoin(sitemap_url, loc), depth + 1))
+                    else:
+                        yield urljoin(sitemap_url, loc), lastmod
+            except (ParseError, OSError) as e:
+                print(f"Error parsing sitemap {sitemap_url}: {str(e)}")
+            finally:
+                response.close()
+
+    # Function to decide whether a page is new or changed since we last queued it
+    def is_stale(self, url, lastmod):
+        with self._lock:
+            known = self.state['pages'].get(url)
+        if known is None:
+            return True
+        modified = parse_lastmod(lastmod)
+        if modified is not None:
+            return known.get('lastmod') is None or modified > known['lastmod']
+        return time.time() - known.get('queued', 0) > self.revisit_after
+
+    # Function to remember that a page was scraped at this lastmod
+    def mark_queued(self, url, lastmod):
+        with self._lock:
+            self.state['pages'][url] = {'lastmod': parse_lastmod(lastmod), 'queued': time.time()}
+
+    # Function to remember the discovered pages that made it into standardized records. Pages that
+    # failed to fetch or parse are left stale, so they are queued again on the next run.
+    def mark_scraped(self, records, lastmods):
+        for record in records:
+            if record['url'] in lastmods:
+                self.mark_queued(record['url'], lastmods[record['url']])
+
+    # Function to find project pages on the seed URLs' hosts that are new or modified, at most
+    # max_pages_per_seed per seed (the rest are found again next run). Returns
+    # {seed_url: [(page_url, lastmod), ...]}; each host's sitemaps are read once.
+    def discover(self, seed_urls, max_pages_per_seed=None):
+        seeds_by_host = {}
+        for seed in seed_urls:
+            seeds_by_host.setdefault(host_of(seed), []).append(seed)
+        changed = {seed: [] for seed in seed_urls}
+        for host, seeds in seeds_by_host.items():
+            seed_set = set(seeds)
+            budget = len(seeds) * max_pages_per_seed if max_pages_per_seed is not None else None
+            count = 0
+            for url, lastmod in self.iter_pages(seeds[0]):
+                if budget is not None and count >= budget:
+                    break
+                if url in seed_set or host_of(url) != host or not looks_like_project(url):
+                    continue
+                seed = self.closest_seed(url, seeds)
+                if max_pages_per_seed is not None and len(changed[seed]) >= max_pages_per_seed:
+                    continue
+                if not self.is_stale(url, lastmod) or not self.allowed(url):
+                    continue
+                changed[seed].append((url, lastmod))
+                count += 1
+            print(f"Discovered {count} new or modified pages on {host}")
+        return changed
+
+    # Function to attribute a page to the seed whose path shares the longest prefix with it
+    def closest_seed(self, url, seeds):
+        path = urlsplit(url).path
+        return max(seeds, key=lambda seed: len(os.path.commonprefix([path, urlsplit(seed).path])))
+
+    # Function to load robots.txt bodies and page lastmods from a previous run
+    def load_state(self):
+        path = existing_path(self.state_path) if self.state_path else None
+        if path is None:
+            return
+        try:
+            with open_compressed(path, 'r') as file:
+                state = json.load(file)
+            self.state['robots'].update(state.get('robots', {}))
+            self.state['pages'].update(state.get('pages', {}))
+        except Exception as e:
+            print(f"Error loading discovery state {path}: {str(e)}")
+
+    # Function to save discovery state for the next run
+    def save_state(self):
+        if not self.state_path:
+            return
+        with self._lock:
+            data = json.dumps(self.state)
+        # Keep the compression suffix last so the temporary file is written the same way
+        directory, name = os.path.split(self.state_path)
+        tmp_path = os.path.join(directory, '.tmp-' + name)
+        with open_compressed(tmp_path, 'w') as file:
+            file.write(data)
+        os.replace(tmp_path, self.state_path)
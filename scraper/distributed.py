@@ -0,0 +1,343 @@
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from scraper.compression import open_compressed
+from scraper.discovery import Discovery
+from scraper.fetch import FetchClient, host_of
+from scraper.pagecache import PageCache
+from scraper.resources import ResourceGovernor, available_cpus
+from scraper.standardize import merge_into_csv, write_to_csv
+from scraper.tasks import scrape_and_crawl
+
+DEFAULT_LEASE_SECONDS = 300
+# A shard that failed this many times is not handed out again
+MAX_ATTEMPTS = 3
+
+
+# Function to pick the shard of a URL from its host, so one host is only ever crawled by one
+# worker at a time and politeness limits (crawl delay, circuit breaker) stay node-local
+def shard_for(url, num_shards):
+    digest = hashlib.blake2b(host_of(url).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') % num_shards
+
+
+# Function to group URLs into shards by host hash; empty shards are left out
+def make_shards(urls, num_shards):
+    shards = {}
+    for url in urls:
+        shards.setdefault(shard_for(url, num_shards), []).append(url)
+    return shards
+
+
+# Function to make a run id: timestamp (so runs sort by creation) plus a random suffix, so runs
+# created in the same second never collide
+def make_run_id():
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+# Function to make a worker id that is unique across machines and processes
+def make_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+# Coordinator backed by a SQLite file that every worker can open (local disk or a shared mount).
+# Workers lease a shard for a limited time and renew the lease with heartbeats; a shard whose
+# lease expired (its worker died) is handed to the next worker that asks.
+class SQLiteCoordinator:
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS shards (
+                    run_id TEXT NOT NULL,
+                    shard INTEGER NOT NULL,
+                    urls TEXT NOT NULL,
+                    state TEXT NOT NULL DEFAULT 'pending',
+                    worker TEXT,
+                    lease_expires REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    output TEXT,
+                    created_at REAL,
+                    PRIMARY KEY (run_id, shard)
+                )""")
+            # Coordinator files from before runs recorded their creation time
+            columns = {row['name'] for row in connection.execute("PRAGMA table_info(shards)")}
+            if 'created_at' not in columns:
+                connection.execute("ALTER TABLE shards ADD COLUMN created_at REAL")
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        return _Transaction(connection)
+
+    # Function to register the shards of a new run and return its id
+    def create_run(self, shards, run_id=None):
+        run_id = run_id or make_run_id()
+        created_at = time.time()
+        with self._connect() as connection:
+            connection.executemany("INSERT INTO shards (run_id, shard, urls, created_at) VALUES (?, ?, ?, ?)",
+                                   [(run_id, shard, json.dumps(urls), created_at)
+                                    for shard, urls in sorted(shards.items())])
+        return run_id
+
+    # Function to lease the next pending (or expired) shard; returns (run_id, shard, urls) or None.
+    # Without a run id, shards of the most recently created run are handed out first.
+    def lease(self, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS, run_id=None):
+        now = time.time()
+        with self._connect() as connection:
+            row = connection.execute("""
+                SELECT run_id, shard, urls FROM shards
+                WHERE (state = 'pending' OR (state = 'leased' AND lease_expires < ?)) AND attempts < ?
+                  AND (? IS NULL OR run_id = ?)
+                ORDER BY created_at DESC, run_id DESC, shard LIMIT 1""", (now, MAX_ATTEMPTS, run_id, run_id)).fetchone()
+            if row is None:
+                return None
+            connection.execute("""
+                UPDATE shards SET state = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1
+                WHERE run_id = ? AND shard = ?""", (worker_id, now + lease_seconds, row['run_id'], row['shard']))
+        return row['run_id'], row['shard'], json.loads(row['urls'])
+
+    # Function to renew a lease; returns False if the shard was given to another worker meanwhile
+    def heartbeat(self, run_id, shard, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        with self._connect() as connection:
+            cursor = connection.execute("""
+                UPDATE shards SET lease_expires = ?
+                WHERE run_id = ? AND shard = ? AND worker = ? AND state = 'leased'""",
+                                        (time.time() + lease_seconds, run_id, shard, worker_id))
+            return cursor.rowcount == 1
+
+    # Function to mark a shard done with the path of its partial output
+    def complete(self, run_id, shard, worker_id, output):
+        with self._connect() as connection:
+            cursor = connection.execute("""
+                UPDATE shards SET state = 'done', output = ?, lease_expires = NULL
+                WHERE run_id = ? AND shard = ? AND worker = ? AND state = 'leased'""",
+                                        (output, run_id, shard, worker_id))
+            return cursor.rowcount == 1
+
+    # Function to count the shards of a run per state ('failed' are leased shards out of attempts)
+    def progress(self, run_id):
+        with self._connect() as connection:
+            rows = connection.execute("""
+                SELECT CASE WHEN state != 'done' AND attempts >= ? AND (lease_expires IS NULL OR lease_expires < ?)
+                            THEN 'failed' ELSE state END AS state, COUNT(*) AS count
+                FROM shards WHERE run_id = ? GROUP BY 1""", (MAX_ATTEMPTS, time.time(), run_id)).fetchall()
+        return {row['state']: row['count'] for row in rows}
+
+    # Function to list the partial outputs of the finished shards of a run
+    def outputs(self, run_id):
+        with self._connect() as connection:
+            rows = connection.execute("SELECT output FROM shards WHERE run_id = ? AND state = 'done' ORDER BY shard",
+                                      (run_id,)).fetchall()
+        return [row['output'] for row in rows if row['output']]
+
+    # Function to get the most recently created run
+    def latest_run(self):
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT run_id FROM shards ORDER BY created_at DESC, run_id DESC LIMIT 1").fetchone()
+        return row['run_id'] if row else None
+
+
+# Wraps a connection so each `with` block is one immediate (write-locking) transaction
+class _Transaction:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+        return self.connection
+
+    def __exit__(self, exc_type, exc, traceback):
+        try:
+            self.connection.execute('ROLLBACK' if exc_type else 'COMMIT')
+        finally:
+            self.connection.close()
+
+
+# Renews a lease in the background while a shard is being worked on
+class Heartbeat:
+    def __init__(self, coordinator, run_id, shard, worker_id, lease_seconds):
+        self.coordinator = coordinator
+        self.args = (run_id, shard, worker_id, lease_seconds)
+        self.interval = lease_seconds / 3.0
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"heartbeat-{shard}", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                alive = self.coordinator.heartbeat(*self.args)
+            except Exception as e:
+                print(f"Error renewing lease of shard {self.args[1]}: {str(e)}")
+                continue
+            if not alive:
+                self.lost.set()
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self._stop.set()
+        self._thread.join()
+
+
+# Function to lease and process shards until none are left. scrape_shard(shard, urls) returns
+# standardized records; each shard's records go to their own CSV in output_dir. Without a run id
+# the worker settles on the latest run before its first lease and only works on that run.
+def run_worker(coordinator, scrape_shard, output_dir, worker_id=None, lease_seconds=DEFAULT_LEASE_SECONDS,
+               run_id=None):
+    worker_id = worker_id or make_worker_id()
+    run_id = run_id or coordinator.latest_run()
+    if run_id is None:
+        print(f"Worker {worker_id}: no runs to work on")
+        return 0
+    os.makedirs(output_dir, exist_ok=True)
+    completed = 0
+    while True:
+        leased = coordinator.lease(worker_id, lease_seconds, run_id=run_id)
+        if leased is None:
+            # Shards still leased by other workers come back if those workers die; keep polling for them
+            progress = coordinator.progress(run_id)
+            if progress.get('leased'):
+                time.sleep(min(lease_seconds / 3.0, 10))
+                continue
+            print(f"Worker {worker_id}: no shards left, {completed} completed")
+            return completed
+        shard_run, shard, urls = leased
+        print(f"Worker {worker_id}: shard {shard} of run {shard_run} ({len(urls)} URLs)")
+        with Heartbeat(coordinator, shard_run, shard, worker_id, lease_seconds) as heartbeat:
+            try:
+                records = scrape_shard(shard, urls)
+            except Exception as e:
+                # Leave the lease to expire so another worker retries the shard
+                print(f"Worker {worker_id}: error in shard {shard}: {str(e)}")
+                continue
+        if heartbeat.lost.is_set():
+            print(f"Worker {worker_id}: lost the lease of shard {shard}, dropping its output")
+            continue
+        # Shard outputs are kept gzip-compressed until the run is merged
+        output = os.path.join(output_dir, f"shard-{shard_run}-{shard:05d}.csv.gz")
+        tmp_output = os.path.join(output_dir, f".tmp-shard-{shard_run}-{shard:05d}.csv.gz")
+        write_to_csv(records, tmp_output)
+        os.replace(tmp_output, output)
+        if coordinator.complete(shard_run, shard, worker_id, output):
+            completed += 1
+
+
+# Function to merge the partial outputs of a finished run into the standardized dataset
+def merge_run(coordinator, run_id, output_file):
+    progress = coordinator.progress(run_id)
+    if progress.get('pending') or progress.get('leased'):
+        print(f"Run {run_id} is not finished yet: {progress}")
+    records = []
+    for path in coordinator.outputs(run_id):
+        try:
+            with open_compressed(path, 'r', newline='') as file:
+                records.extend(csv.DictReader(file))
+        except FileNotFoundError:
+            print(f"Missing shard output {path}")
+    merge_into_csv(records, output_file)
+    return len(records)
+
+
+# Function to get the file a host's fetch health and discovery state are kept in. State is kept per
+# host rather than per shard, so it stays with the host when the number of shards changes.
+def host_state_path(state_dir, host):
+    name = ''.join(char if char.isalnum() or char in '.-' else '_' for char in host)
+    return os.path.join(state_dir, 'hosts', f"{name}.json.gz")
+
+
+# Function to load the saved state of a shard's hosts into its fetch client and discovery
+def load_host_state(state_dir, hosts, fetch_client, discovery):
+    for host in hosts:
+        path = host_state_path(state_dir, host)
+        if not os.path.exists(path):
+            continue
+        try:
+            with open_compressed(path, 'r') as file:
+                state = json.load(file)
+        except Exception as e:
+            print(f"Error loading host state {path}: {str(e)}")
+            continue
+        if state.get('health'):
+            fetch_client.hosts[host] = state['health']
+        if state.get('robots'):
+            discovery.state['robots'][host] = state['robots']
+        discovery.state['pages'].update(state.get('pages', {}))
+
+
+# Function to save the state of a shard's hosts, one file per host. Only the worker holding the
+# shard's lease writes them, so workers never write the same file.
+def save_host_state(state_dir, hosts, fetch_client, discovery):
+    pages = {}
+    for url, page in discovery.state['pages'].items():
+        pages.setdefault(host_of(url), {})[url] = page
+    os.makedirs(os.path.join(state_dir, 'hosts'), exist_ok=True)
+    for host in hosts:
+        state = {'health': fetch_client.hosts.get(host), 'robots': discovery.state['robots'].get(host),
+                 'pages': pages.get(host, {})}
+        path = host_state_path(state_dir, host)
+        tmp_path = os.path.join(os.path.dirname(path), '.tmp-' + os.path.basename(path))
+        with open_compressed(tmp_path, 'w') as file:
+            file.write(json.dumps(state))
+        os.replace(tmp_path, path)
+
+
+# Function to build the per-shard job: the shard's hosts' state is loaded before it is scraped and
+# saved after. With a page cache, fetched pages are kept in it.
+def make_shard_scraper(state_dir, page_cache=None, **options):
+    def scrape_shard(shard, urls):
+        hosts = sorted({host_of(url) for url in urls})
+        fetch_client = FetchClient(page_cache=page_cache)
+        discovery = Discovery(fetch_client)
+        load_host_state(state_dir, hosts, fetch_client, discovery)
+        records = scrape_and_crawl(urls, fetch_client, discovery, **options)
+        save_host_state(state_dir, hosts, fetch_client, discovery)
+        return records
+    return scrape_shard
+
+
+# Function to run one worker against a SQLite coordinator (module level so it can be a child process).
+# Without a run id it works on the latest run.
+# The resource split saved by the tune command is used if it was measured for this worker's cores.
+def worker_main(db_path, parts_dir, state_dir, lease_seconds=DEFAULT_LEASE_SECONDS, run_id=None, cpus=None,
+                resources=None, page_cache=None, **options):
+    os.makedirs(state_dir, exist_ok=True)
+    governor = ResourceGovernor.load(resources, cpus=cpus)
+    governor.apply_torch()
+    # Each worker process opens the page cache itself; SQLite connections can't be shared between processes
+    page_cache = PageCache(page_cache) if page_cache else None
+    scrape_shard = make_shard_scraper(state_dir, page_cache=page_cache, governor=governor, **options)
+    return run_worker(SQLiteCoordinator(db_path), scrape_shard, parts_dir, lease_seconds=lease_seconds,
+                      run_id=run_id)
+
+
+# Function to run a whole sharded run on this machine: register the shards, start worker
+# processes that share the cores, wait for them and merge their outputs
+def run_local(db_path, urls, output_file, num_shards=16, num_workers=2, parts_dir='parts', state_dir='.',
+              lease_seconds=DEFAULT_LEASE_SECONDS, **options):
+    coordinator = SQLiteCoordinator(db_path)
+    run_id = coordinator.create_run(make_shards(urls, num_shards))
+    cpus = max(1, available_cpus() // num_workers)
+    print(f"Run {run_id}: {num_workers} workers with {cpus} cpus each")
+    workers = [multiprocessing.Process(target=worker_main, args=(db_path, parts_dir, state_dir, lease_seconds, run_id,
+                                                                 cpus), kwargs=options, name=f"worker-{i}")
+               for i in range(num_workers)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    print(f"Run {run_id} progress: {coordinator.progress(run_id)}")
+    return merge_run(coordinator, run_id, output_file)
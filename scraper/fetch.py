@@ -0,0 +1,182 @@
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+
+from scraper.compression import accept_encoding, existing_path, open_compressed
+
+# Default host health file; gzipped, and read from an older uncompressed host_health.json if there is one
+HOST_STATE_FILE = 'host_health.json.gz'
+# Status codes worth retrying; any other non-200 answer is final for that URL
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Request errors worth retrying, and counted against the host. Others (a malformed URL, an
+# unsupported scheme, too many redirects) are the URL's fault and fail at once.
+TRANSIENT_ERRORS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+
+# Function to get the host part of a URL (the unit health is tracked by)
+def host_of(url):
+    return urlsplit(url).netloc.lower()
+
+
+# Function to turn a Retry-After header (seconds or HTTP date) into seconds to wait
+def parse_retry_after(value):
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+# Fetch layer with timeouts, jittered exponential backoff and a per-host circuit breaker.
+# Host health is kept in a JSON file (compressed when the path ends in .gz/.zst) so dead hosts stay
+# skipped across runs. With a page cache, every fetched page is also stored compressed for replay.
+class FetchClient:
+    def __init__(self, state_path=None, timeout=(10, 30), max_retries=3, backoff_base=1.0, backoff_max=60.0,
+                 failure_threshold=3, cooldown=6 * 3600, session=None, page_cache=None):
+        self.state_path = state_path
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.session = session or requests.Session()
+        # Ask for compressed bodies; brotli only when it can be decoded here
+        self.session.headers['Accept-Encoding'] = accept_encoding()
+        self.page_cache = page_cache
+        self.hosts = {}
+        self.crawl_delays = {}
+        self._next_request = {}
+        self._lock = threading.Lock()
+        if state_path:
+            self.load_state()
+
+    # Function to fetch a URL and return its body, or None if it failed or the host is skipped
+    def fetch(self, url):
+        response = self.request(url)
+        if response is None:
+            return None
+        if self.page_cache is not None:
+            self.page_cache.put(url, response.content)
+        return response.content
+
+    # Function to GET a URL with retries and return the 200 response, or None.
+    # With stream=True the body is not read yet; the caller must close the response.
+    def request(self, url, stream=False):
+        host = host_of(url)
+        if self.is_open(host):
+            print(f"Skipping {url}: circuit open for {host}")
+            return None
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            self.wait_for_turn(host)
+            try:
+                response = self.session.get(url, timeout=self.timeout, stream=stream)
+            except TRANSIENT_ERRORS as e:
+                error = f"{type(e).__name__}: {str(e)}"
+            except requests.RequestException as e:
+                print(f"Failed to fetch {url}: {type(e).__name__}: {str(e)}")
+                return None
+            else:
+                if response.status_code == 200:
+                    self.record_success(host)
+                    return response
+                response.close()
+                if response.status_code not in RETRY_STATUSES:
+                    # The host answered; the page itself is the problem
+                    print(f"Failed to fetch {url}: HTTP {response.status_code}")
+                    return None
+                error = f"HTTP {response.status_code}"
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if attempt == self.max_retries:
+                break
+            delay = self.backoff_delay(attempt, retry_after)
+            print(f"Error fetching {url} ({error}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+        print(f"Error fetching {url}: {error}")
+        self.record_failure(host, error)
+        return None
+
+    # Function to set the minimum gap between requests to a host (e.g. robots.txt Crawl-delay)
+    def set_crawl_delay(self, host, delay):
+        with self._lock:
+            self.crawl_delays[host] = float(delay or 0)
+
+    # Function to sleep until the host's crawl delay since our last request has passed
+    def wait_for_turn(self, host):
+        with self._lock:
+            delay = self.crawl_delays.get(host, 0)
+            now = time.monotonic()
+            ready_at = max(now, self._next_request.get(host, 0))
+            self._next_request[host] = ready_at + delay
+        if ready_at > now:
+            time.sleep(ready_at - now)
+
+    # Function to compute the wait before the next attempt (full jitter, capped, Retry-After wins)
+    def backoff_delay(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    # Function to check whether a host is in its cooldown window
+    def is_open(self, host):
+        with self._lock:
+            state = self.hosts.get(host)
+            return bool(state) and state.get('open_until', 0) > time.time()
+
+    # Function to record a successful fetch and close the circuit
+    def record_success(self, host):
+        with self._lock:
+            state = self.hosts.setdefault(host, {})
+            state['failures'] = 0
+            state['open_until'] = 0
+            state['last_success'] = time.time()
+
+    # Function to record a failed fetch and open the circuit after repeated failures
+    def record_failure(self, host, error):
+        with self._lock:
+            state = self.hosts.setdefault(host, {})
+            state['failures'] = state.get('failures', 0) + 1
+            state['last_failure'] = time.time()
+            state['last_error'] = error
+            if state['failures'] >= self.failure_threshold:
+                state['open_until'] = time.time() + self.cooldown
+                print(f"Circuit opened for {host} after {state['failures']} failures")
+
+    # Function to load host health saved by a previous run
+    def load_state(self):
+        path = existing_path(self.state_path) if self.state_path else None
+        if path is None:
+            return
+        try:
+            with open_compressed(path, 'r') as file:
+                self.hosts = json.load(file)
+        except Exception as e:
+            print(f"Error loading host state {path}: {str(e)}")
+
+    # Function to save host health for the next run
+    def save_state(self):
+        if not self.state_path:
+            return
+        with self._lock:
+            data = json.dumps(self.hosts, indent=2, sort_keys=True)
+        # Keep the compression suffix last so the temporary file is written the same way
+        directory, name = os.path.split(self.state_path)
+        tmp_path = os.path.join(directory, '.tmp-' + name)
+        with open_compressed(tmp_path, 'w') as file:
+            file.write(data)
+        os.replace(tmp_path, self.state_path)
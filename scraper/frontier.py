@@ -0,0 +1,141 @@
+import hashlib
+import heapq
+import itertools
+import math
+import time
+from urllib.parse import urldefrag, urljoin, urlsplit
+
+from scraper.fetch import host_of
+
+# Weights for words in a link's URL or anchor text; the sum is the link's priority
+LINK_KEYWORDS = {
+    'project': 3, 'construction': 3, 'capital': 2, 'improvement': 2, 'infrastructure': 2,
+    'bid': 2, 'tender': 2, 'rfp': 2, 'contract': 1, 'development': 1, 'planning': 1,
+    'road': 1, 'bridge': 1, 'water': 1, 'sewer': 1, 'facility': 1, 'park': 1,
+}
+# Links containing these are never worth a request
+SKIP_KEYWORDS = ('login', 'calendar', 'facebook', 'twitter', 'instagram', 'youtube', 'linkedin',
+                 'subscribe', 'print', 'search', 'sitemap', 'translate')
+SKIP_EXTENSIONS = ('.pdf', '.jpg', '.jpeg', '.png', '.gif', '.zip', '.doc', '.docx', '.xls', '.xlsx', '.mp4')
+
+
+# Function to score a link by its URL and anchor text before fetching it (0 means skip)
+def score_link(url, anchor_text=''):
+    path = urlsplit(url).path.lower()
+    text = f"{path} {anchor_text.lower()}"
+    if path.endswith(SKIP_EXTENSIONS) or any(keyword in text for keyword in SKIP_KEYWORDS):
+        return 0
+    return sum(weight for keyword, weight in LINK_KEYWORDS.items() if keyword in text)
+
+
+# Function to pull (absolute url, anchor text) pairs out of already parsed HTML
+def links_from_soup(soup, base_url):
+    links = []
+    for anchor in soup.find_all('a', href=True):
+        try:
+            url = urldefrag(urljoin(base_url, anchor['href'].strip()))[0]
+        except ValueError:
+            # e.g. "http://[broken" (Invalid IPv6 URL); skip the link, not the page
+            continue
+        if url.startswith(('http://', 'https://')):
+            links.append((url, anchor.get_text(' ', strip=True)))
+    return links
+
+
+# Bloom filter for the visited set: a fixed-size bit array, so memory stays flat at millions of URLs
+class BloomFilter:
+    def __init__(self, capacity=1000000, error_rate=0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    # Function to get the bit positions of an item (double hashing on one blake2b digest)
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    # Function to add an item; returns True if it was not in the set before
+    def add(self, item):
+        added = False
+        for position in self._positions(item):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                self.bits[position >> 3] |= mask
+                added = True
+        return added
+
+
+# Crawl frontier behind the listing (seed) pages: links are scored before fetching, each seed
+# has a depth and page budget, and requests are spread across hosts by per-host ready times
+class CrawlFrontier:
+    def __init__(self, max_depth=2, max_pages_per_seed=25, min_score=2, host_delay=1.0, capacity=1000000):
+        self.max_depth = max_depth
+        self.max_pages_per_seed = max_pages_per_seed
+        self.min_score = min_score
+        self.host_delay = host_delay
+        self.visited = BloomFilter(capacity)
+        self.pages_per_seed = {}
+        self._host_queues = {}
+        self._ready = []
+        self._next_ready = {}
+        self._counter = itertools.count()
+
+    # Function to mark a URL as already seen so it is never queued
+    def mark_visited(self, url):
+        self.visited.add(url)
+
+    # Function to queue a URL; the caller has already checked score and budgets
+    def push(self, url, depth, seed, score):
+        host = host_of(url)
+        host_queue = self._host_queues.get(host)
+        if host_queue is None:
+            host_queue = self._host_queues[host] = []
+            heapq.heappush(self._ready, (max(time.monotonic(), self._next_ready.get(host, 0)), host))
+        heapq.heappush(host_queue, (-score, next(self._counter), url, depth, seed))
+
+    # Function to score and queue (url, anchor text) links found on a page at `depth`
+    def queue_links(self, links, depth, seed):
+        if depth >= self.max_depth:
+            return 0
+        seed_host = host_of(seed)
+        queued = 0
+        for url, anchor_text in links:
+            # Stay on the seed's site; project pages live on the city's own host
+            if host_of(url) != seed_host:
+                continue
+            score = score_link(url, anchor_text)
+            if score < self.min_score or not self.visited.add(url):
+                continue
+            self.push(url, depth + 1, seed, score)
+            queued += 1
+        return queued
+
+    # Function to take the best URL of the host that is ready soonest.
+    # Returns (url, depth, seed, wait_seconds) or None when the frontier is empty.
+    def pop(self):
+        while self._ready:
+            ready_at, host = heapq.heappop(self._ready)
+            host_queue = self._host_queues[host]
+            while host_queue:
+                _, _, url, depth, seed = heapq.heappop(host_queue)
+                if self.pages_per_seed.get(seed, 0) >= self.max_pages_per_seed:
+                    continue
+                self.pages_per_seed[seed] = self.pages_per_seed.get(seed, 0) + 1
+                now = time.monotonic()
+                # Remember when the host may be hit again, even if its queue empties now
+                self._next_ready[host] = max(ready_at, now) + self.host_delay
+                if host_queue:
+                    heapq.heappush(self._ready, (self._next_ready[host], host))
+                else:
+                    del self._host_queues[host]
+                return url, depth, seed, max(0.0, ready_at - now)
+            del self._host_queues[host]
+        return None
+
+    def __len__(self):
+        return sum(len(host_queue) for host_queue in self._host_queues.values())
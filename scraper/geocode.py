@@ -0,0 +1,272 @@
+import bisect
+import csv
+import functools
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+import unicodedata
+from urllib.parse import urlparse
+
+# Bundled places (Census gazetteer layout); `python -m scraper gazetteer` builds the index from a full national file
+GAZETTEER_PATH = os.path.join(os.path.dirname(__file__), 'data', 'us_places.txt')
+INDEX_PATH = os.path.join(os.path.dirname(__file__), 'data', 'us_places.idx')
+
+# Index layout: magic, record count, then fixed-width records sorted by (key, state).
+# The key is the normalized name without spaces, so "Elk Grove" and "elkgrove" meet.
+INDEX_MAGIC = b'GAZ1'
+HEADER = struct.Struct('<4sI')
+RECORD = struct.Struct('<32s48s2sff')
+KEY_SIZE = 32
+# Entries memoized per lookup function; the keys come from uploaded City columns and URLs
+LOOKUP_CACHE_SIZE = 65536
+
+STATE_NAMES = {
+    'AL': 'Alabama', 'AK': 'Alaska', 'AZ': 'Arizona', 'AR': 'Arkansas', 'CA': 'California', 'CO': 'Colorado',
+    'CT': 'Connecticut', 'DE': 'Delaware', 'DC': 'District of Columbia', 'FL': 'Florida', 'GA': 'Georgia',
+    'HI': 'Hawaii', 'ID': 'Idaho', 'IL': 'Illinois', 'IN': 'Indiana', 'IA': 'Iowa', 'KS': 'Kansas',
+    'KY': 'Kentucky', 'LA': 'Louisiana', 'ME': 'Maine', 'MD': 'Maryland', 'MA': 'Massachusetts', 'MI': 'Michigan',
+    'MN': 'Minnesota', 'MS': 'Mississippi', 'MO': 'Missouri', 'MT': 'Montana', 'NE': 'Nebraska', 'NV': 'Nevada',
+    'NH': 'New Hampshire', 'NJ': 'New Jersey', 'NM': 'New Mexico', 'NY': 'New York', 'NC': 'North Carolina',
+    'ND': 'North Dakota', 'OH': 'Ohio', 'OK': 'Oklahoma', 'OR': 'Oregon', 'PA': 'Pennsylvania',
+    'PR': 'Puerto Rico', 'RI': 'Rhode Island', 'SC': 'South Carolina', 'SD': 'South Dakota', 'TN': 'Tennessee',
+    'TX': 'Texas', 'UT': 'Utah', 'VT': 'Vermont', 'VA': 'Virginia', 'WA': 'Washington', 'WV': 'West Virginia',
+    'WI': 'Wisconsin', 'WY': 'Wyoming',
+}
+STATE_CODES = {name.lower(): code for code, name in STATE_NAMES.items()}
+
+# Census place names end in their legal/statistical area type ("Richmond city", "McKinleyville CDP")
+PLACE_SUFFIX = re.compile(r'\s+(city|town|village|borough|municipality|CDP|city and borough|consolidated government'
+                          r'|metropolitan government|unified government|urban county)$')
+# "City of Richmond", and capitalized words before a state ("Santa Rosa, CA", "Eureka, California")
+CITY_OF = re.compile(r'\b(?:City|Town) of ((?:[A-Z][\w.\'-]*)(?: [A-Z][\w.\'-]*){0,3})')
+PLACE_STATE = re.compile(r'((?:[A-Z][\w.\'-]*)(?: [A-Z][\w.\'-]*){0,4}),\s*([A-Z]{2}|[A-Z][a-z]+(?: [A-Z][a-z]+)?)\b')
+# Host labels that never name a place
+GENERIC_LABELS = {'www', 'ci', 'co', 'city', 'gov', 'org', 'com', 'net', 'us', 'info', 'edu'}
+
+
+# Function to normalize a place name into an index key: no accents, case, punctuation,
+# parenthesized notes ("Fairfield (Public Works)") or spaces
+def normalize(name):
+    name = re.sub(r'\(.*?\)', ' ', name)
+    name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode()
+    return re.sub(r'[^a-z0-9]', '', name.lower()).encode()[:KEY_SIZE]
+
+
+# Function to read a gazetteer file (tab separated, Census USPS/NAME/INTPTLAT/INTPTLONG columns)
+# into (key, name, state, lat, lon) rows. Names with an alternate form in parentheses, like
+# "El Paso de Robles (Paso Robles) city", are indexed under both.
+def read_gazetteer(path):
+    with open(path, 'r', newline='', encoding='utf-8', errors='replace') as file:
+        reader = csv.reader(file, delimiter='\t')
+        header = [column.strip() for column in next(reader)]
+        state_column, name_column = header.index('USPS'), header.index('NAME')
+        lat_column, lon_column = header.index('INTPTLAT'), header.index('INTPTLONG')
+        for row in reader:
+            try:
+                state = row[state_column].strip()
+                lat, lon = float(row[lat_column]), float(row[lon_column])
+            except (IndexError, ValueError):
+                continue
+            name = PLACE_SUFFIX.sub('', row[name_column].strip())
+            alternate = re.search(r'\((.*?)\)', name)
+            names = [re.sub(r'\s*\(.*?\)', '', name)]
+            if alternate:
+                names.append(alternate.group(1))
+            for name in names:
+                key = normalize(name)
+                if key:
+                    yield key, name, state, lat, lon
+
+
+# Function to build the binary index from a gazetteer file; written atomically so readers never see half of it
+def build_index(source_path=GAZETTEER_PATH, index_path=INDEX_PATH):
+    rows = {}
+    for key, name, state, lat, lon in read_gazetteer(source_path):
+        # The first row of a (name, state) wins
+        rows.setdefault((key, state), (name, lat, lon))
+    directory = os.path.dirname(os.path.abspath(index_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as file:
+        file.write(HEADER.pack(INDEX_MAGIC, len(rows)))
+        for (key, state), (name, lat, lon) in sorted(rows.items()):
+            file.write(RECORD.pack(key, name.encode('utf-8')[:48], state.encode('ascii', 'ignore')[:2], lat, lon))
+    os.replace(tmp_path, index_path)
+    print(f"Gazetteer index with {len(rows)} places written to {index_path}")
+    return index_path
+
+
+# A resolved place. Its GeoJSON point is created once and shared by every record in that place.
+class Place:
+    __slots__ = ('name', 'state_code', 'state_name', 'coordinates')
+
+    def __init__(self, name, state_code, lat, lon):
+        self.name = name
+        self.state_code = state_code
+        self.state_name = STATE_NAMES.get(state_code, state_code)
+        self.coordinates = {"type": "Point", "coordinates": [round(lon, 4), round(lat, 4)]}
+
+    def __repr__(self):
+        return f"Place({self.name}, {self.state_code})"
+
+
+# Sorted keys of the memory-mapped index, readable by bisect without loading them
+class _Keys:
+    def __init__(self, data, count):
+        self.data = data
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        offset = HEADER.size + i * RECORD.size
+        return self.data[offset:offset + KEY_SIZE]
+
+
+# Offline geocoder over the memory-mapped gazetteer index: exact and prefix lookups by normalized
+# name, and resolution of a record's place from the City column, the URL host or its text.
+# Lookups are memoized (up to LOOKUP_CACHE_SIZE each), so repeated places cost a dict hit.
+class Geocoder:
+    def __init__(self, index_path=INDEX_PATH, source_path=GAZETTEER_PATH, default_state='CA'):
+        self.default_state = default_state
+        index_path = self._ensure_index(index_path, source_path)
+        with open(index_path, 'rb') as file:
+            self._data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = HEADER.unpack_from(self._data)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{index_path} is not a gazetteer index")
+        self._keys = _Keys(self._data, count)
+        self.lookup = functools.lru_cache(maxsize=LOOKUP_CACHE_SIZE)(self._lookup)
+        self.from_host = functools.lru_cache(maxsize=LOOKUP_CACHE_SIZE)(self._from_host)
+        self.from_text = functools.lru_cache(maxsize=LOOKUP_CACHE_SIZE)(self._from_text)
+
+    # Function to (re)build the index from the bundled gazetteer when it is missing or older;
+    # falls back to the temp directory when the package folder is read-only
+    @staticmethod
+    def _ensure_index(index_path, source_path):
+        fallback_path = os.path.join(tempfile.gettempdir(), os.path.basename(index_path))
+        # A fresh index built in the temp directory by an earlier start counts too
+        for path in (index_path, fallback_path):
+            if os.path.exists(path) and (not os.path.exists(source_path) or
+                                         os.path.getmtime(path) >= os.path.getmtime(source_path)):
+                return path
+        try:
+            return build_index(source_path, index_path)
+        except OSError:
+            return build_index(source_path, fallback_path)
+
+    def _record(self, i):
+        key, name, state, lat, lon = RECORD.unpack_from(self._data, HEADER.size + i * RECORD.size)
+        return name.rstrip(b'\0').decode('utf-8', 'replace'), state.rstrip(b'\0').decode(), lat, lon
+
+    # Function to find the index range of a normalized key
+    def _range(self, key):
+        padded = key.ljust(KEY_SIZE, b'\0')
+        start = bisect.bisect_left(self._keys, padded)
+        end = start
+        while end < len(self._keys) and self._keys[end] == padded:
+            end += 1
+        return start, end
+
+    # Function to look up a place by name; with several matches, the given state wins, then the default state
+    def _lookup(self, name, state=None):
+        key = normalize(name)
+        if not key:
+            return None
+        start, end = self._range(key)
+        if start == end:
+            return None
+        candidates = [self._record(i) for i in range(start, end)]
+        for preferred in (state, self.default_state):
+            for candidate in candidates:
+                if candidate[1] == preferred:
+                    return Place(*candidate)
+        if state:
+            return None
+        return Place(*candidates[0])
+
+    # Function to list places whose normalized name starts with the given text (e.g. for completion)
+    def prefix(self, text, limit=10):
+        key = normalize(text)
+        start = bisect.bisect_left(self._keys, key)
+        places = []
+        for i in range(start, min(len(self._keys), start + limit)):
+            if not self._keys[i].startswith(key):
+                break
+            places.append(Place(*self._record(i)))
+        return places
+
+    # Function to resolve a place from a URL host, e.g. ci.richmond.ca.us, cityofwasco.org,
+    # eurekaca.gov or elkgrovecity.org
+    def _from_host(self, host):
+        labels = [label for label in host.lower().split('.')[:-1] if label not in GENERIC_LABELS]
+        state = next((label.upper() for label in labels if label.upper() in STATE_NAMES), None)
+        for label in labels:
+            if label.upper() in STATE_NAMES:
+                continue
+            label = re.sub(r'^(cityof|townof)', '', label)
+            candidates = [(label, state), (re.sub(r'city$', '', label), state)]
+            if label[-2:].upper() in STATE_NAMES:
+                candidates.append((label[:-2], label[-2:].upper()))
+            for name, candidate_state in candidates:
+                if len(name) < 3:
+                    continue
+                place = self.lookup(name, candidate_state)
+                if place:
+                    return place
+        return None
+
+    # Function to resolve a place named in a page title or description
+    def _from_text(self, text):
+        for match in PLACE_STATE.finditer(text):
+            state = match.group(2)
+            state = state if state in STATE_NAMES else STATE_CODES.get(state.lower())
+            if not state:
+                continue
+            words = match.group(1).split()
+            # Longest trailing run of words first: "Current Projects Santa Rosa" -> "Santa Rosa"
+            for i in range(len(words)):
+                place = self.lookup(' '.join(words[i:]), state)
+                if place:
+                    return place
+        for match in CITY_OF.finditer(text):
+            words = match.group(1).split()
+            for i in range(len(words), 0, -1):
+                place = self.lookup(' '.join(words[:i]))
+                if place:
+                    return place
+        return None
+
+    # Function to resolve a record's place: the source's City column first, then the URL host,
+    # then place names in its text
+    def resolve(self, city=None, url=None, texts=()):
+        if city:
+            place = self.lookup(city)
+            if place:
+                return place
+        if url:
+            place = self.from_host(urlparse(url).netloc.split(':')[0])
+            if place:
+                return place
+        for text in texts:
+            if text:
+                place = self.from_text(text)
+                if place:
+                    return place
+        return None
+
+
+_default_geocoder = None
+_default_lock = threading.Lock()
+
+
+# Function to get the shared geocoder over the bundled gazetteer, created on first use
+def default_geocoder():
+    global _default_geocoder
+    with _default_lock:
+        if _default_geocoder is None:
+            _default_geocoder = Geocoder()
+        return _default_geocoder
@@ -0,0 +1,111 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+import torch
+
+from scraper.relevance import embed_batch
+
+# Sentinel put on the queue to stop the worker
+_STOP = object()
+
+
+# In-process inference service: one dedicated worker owns the model and runs
+# the pending inputs of all concurrent callers together as micro-batches.
+# With a resource governor, the worker follows its inference budget as it adapts.
+class InferenceServer:
+    def __init__(self, tokenizer, model, max_batch_size=16, max_wait_ms=10, max_length=512, num_threads=None,
+                 governor=None):
+        self.tokenizer = tokenizer
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_length = max_length
+        self.num_threads = num_threads
+        self.governor = governor
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    # Function to start the worker thread (safe to call more than once)
+    def start(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='inference-server', daemon=True)
+                self._worker.start()
+        return self
+
+    # Function to stop the worker after the already queued inputs are served
+    def stop(self, timeout=None):
+        with self._lock:
+            worker = self._worker
+            self._worker = None
+        if worker is not None and worker.is_alive():
+            self._queue.put(_STOP)
+            worker.join(timeout)
+
+    # Function to queue one text and get a future resolving to its embedding
+    def submit(self, text):
+        if self._worker is None:
+            self.start()
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    # Function to embed several texts and wait for all of them
+    def embed(self, texts):
+        futures = [self.submit(text) for text in texts]
+        if not futures:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.vstack([future.result() for future in futures])
+
+    # Function to collect the next micro-batch: block for the first input, then
+    # keep taking inputs until the batch is full or max_wait has passed
+    def _next_batch(self):
+        item = self._queue.get()
+        if item is _STOP:
+            return None, True
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    # Worker loop: the only thread that calls the model
+    def _run(self):
+        if self.num_threads and self.governor is None:
+            torch.set_num_threads(self.num_threads)
+        while True:
+            batch, stopping = self._next_batch()
+            if batch:
+                if self.governor is not None:
+                    self.governor.apply_inference_threads()
+                self._run_batch(batch)
+            if stopping:
+                break
+
+    # Function to run one micro-batch and resolve the futures of its callers
+    def _run_batch(self, batch):
+        batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            vectors = embed_batch(self.tokenizer, self.model, [text for text, _ in batch], self.max_length)
+        except Exception as e:
+            print(f"Error running inference batch: {str(e)}")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), vector in zip(batch, vectors):
+            future.set_result(vector)
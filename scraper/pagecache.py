@@ -0,0 +1,137 @@
+import os
+import sqlite3
+import threading
+import time
+
+from scraper.compression import DICT_SIZE, PageCodec, train_dictionary
+
+# Pages sampled for dictionary training
+TRAIN_SAMPLES = 2000
+# Pages read at a time when iterating, and recompressed per transaction when a new dictionary is trained
+RECOMPRESS_BATCH = 500
+
+
+# Compressed store of fetched pages (raw HTML) for replay, in one SQLite file. Pages are compressed
+# with zstd and a dictionary trained on the cached pages themselves, kept next to the database
+# (<path>.dict). Used as a fetch client (fetch(url)) it replays the cached pages.
+class PageCache:
+    def __init__(self, path, dictionary_path=None):
+        self.path = path
+        self.dictionary_path = dictionary_path or path + '.dict'
+        dictionary = None
+        if os.path.exists(self.dictionary_path):
+            with open(self.dictionary_path, 'rb') as file:
+                dictionary = file.read()
+        self.codec = PageCodec(dictionary)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, fetched_at REAL, codec TEXT, size INTEGER, "
+            "data BLOB)")
+        self._connection.commit()
+
+    # Function to store a fetched page, replacing an older copy
+    def put(self, url, content, fetched_at=None):
+        codec, blob = self.codec.compress(content)
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)",
+                                     (url, fetched_at or time.time(), codec, len(content), blob))
+            self._connection.commit()
+
+    # Function to decompress a stored row, or None if it can't be read
+    def _decode(self, url, codec, blob):
+        try:
+            return self.codec.decompress(codec, blob)
+        except Exception as e:
+            print(f"Error reading cached page {url}: {str(e)}")
+            return None
+
+    # Function to get a cached page's content, or None
+    def get(self, url):
+        with self._lock:
+            row = self._connection.execute("SELECT codec, data FROM pages WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        return self._decode(url, row[0], row[1])
+
+    # Replay: the cache stands in for a fetch client
+    def fetch(self, url):
+        return self.get(url)
+
+    # Function to report the number of pages and their raw and stored bytes
+    def stats(self):
+        with self._lock:
+            pages, raw, stored = self._connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(data)), 0) FROM pages").fetchone()
+        return {'pages': pages, 'raw_bytes': raw, 'stored_bytes': stored,
+                'ratio': round(raw / stored, 2) if stored else None}
+
+    # Function to iterate over cached (url, content, fetched_at) entries, reading them in batches
+    def iter_pages(self, batch=RECOMPRESS_BATCH):
+        last_rowid = 0
+        while True:
+            with self._lock:
+                rows = self._connection.execute(
+                    "SELECT rowid, url, fetched_at, codec, data FROM pages WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                    (last_rowid, batch)).fetchall()
+            if not rows:
+                return
+            last_rowid = rows[-1][0]
+            for _, url, fetched_at, codec, blob in rows:
+                content = self._decode(url, codec, blob)
+                if content is not None:
+                    yield url, content, fetched_at
+
+    # Function to train a new dictionary on a random sample of the cached pages, then recompress
+    # every page with it. Only the sample is held in memory; pages are recompressed as they are
+    # read, one transaction per batch.
+    def train(self, samples=TRAIN_SAMPLES, size=DICT_SIZE, batch=RECOMPRESS_BATCH):
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT url, codec, data FROM pages ORDER BY RANDOM() LIMIT ?", (samples,)).fetchall()
+        sample = [content for content in (self._decode(*row) for row in rows) if content is not None]
+        if not sample:
+            print("No cached pages to train a dictionary on")
+            return
+        dictionary = train_dictionary(sample, size=size)
+        sampled = len(sample)
+        del sample, rows
+        old_codec = self.codec
+        new_codec = PageCodec(dictionary)
+        for previous in old_codec._dictionaries.values():
+            new_codec.add_dictionary(previous.as_bytes())
+        tmp_path = self.dictionary_path + '.tmp'
+        with open(tmp_path, 'wb') as file:
+            file.write(dictionary)
+        os.replace(tmp_path, self.dictionary_path)
+        self.codec = new_codec
+        new_name = new_codec.codec()
+        # Walk the table by rowid in batches so neither the pages nor the transactions grow with the cache
+        recompressed = 0
+        last_rowid = 0
+        while True:
+            with self._lock:
+                rows = self._connection.execute(
+                    "SELECT rowid, url, codec, data FROM pages WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                    (last_rowid, batch)).fetchall()
+            if not rows:
+                break
+            last_rowid = rows[-1][0]
+            updates = []
+            for rowid, url, codec, blob in rows:
+                if codec == new_name:
+                    continue
+                content = self._decode(url, codec, blob)
+                if content is not None:
+                    updates.append(new_codec.compress(content) + (rowid,))
+            with self._lock:
+                with self._connection:
+                    self._connection.executemany("UPDATE pages SET codec = ?, data = ? WHERE rowid = ?", updates)
+            recompressed += len(updates)
+        print(f"Trained a {len(dictionary)} byte dictionary on {sampled} pages, recompressed {recompressed} pages: "
+              f"{self.stats()}")
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,274 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Marker passed down the queues once a stage has no more items
+_DONE = object()
+
+MODES = ('thread', 'process', 'async')
+
+
+# One step of a pipeline. `func` takes an item (or a list of items when batch_size > 1)
+# and returns the item for the next stage, None to drop it, or an iterable when fan_out is set.
+# mode: 'thread' runs `workers` threads, 'process' runs func in a pool of `workers` processes,
+# 'async' runs `workers` coroutines of an async func on one event loop.
+# initializer is run once in each worker process of a 'process' stage.
+class Stage:
+    def __init__(self, name, func, workers=1, mode='thread', queue_size=None, batch_size=1, batch_wait_ms=10,
+                 fan_out=False, initializer=None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown stage mode {mode!r}, expected one of {MODES}")
+        self.name = name
+        self.func = func
+        self.workers = max(1, int(workers))
+        self.mode = mode
+        self.queue_size = queue_size
+        self.batch_size = max(1, int(batch_size))
+        self.batch_wait = batch_wait_ms / 1000.0
+        self.fan_out = fan_out
+        self.initializer = initializer
+        self.reset_stats()
+
+    # Function to clear the counters before a run
+    def reset_stats(self):
+        self.processed = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.started = None
+        self.finished = None
+        self._stats_lock = threading.Lock()
+
+    # Function to record how long one call took and how many items it handled
+    def record(self, items, seconds, failed=False):
+        with self._stats_lock:
+            self.processed += items
+            self.busy += seconds
+            if failed:
+                self.errors += items
+
+    # Function to summarise the stage: items per second of wall time and of busy worker time
+    def stats(self):
+        wall = ((self.finished or time.monotonic()) - self.started) if self.started else 0.0
+        return {
+            'stage': self.name,
+            'mode': self.mode,
+            'workers': self.workers,
+            'processed': self.processed,
+            'errors': self.errors,
+            'busy_seconds': round(self.busy, 3),
+            'wall_seconds': round(wall, 3),
+            'items_per_second': round(self.processed / wall, 3) if wall else 0.0,
+            'items_per_worker_second': round(self.processed / self.busy, 3) if self.busy else 0.0,
+        }
+
+
+# Runs stages connected by bounded queues. Every stage works concurrently with the others,
+# and a full queue blocks the stage feeding it, so memory stays flat however long the input is.
+class Pipeline:
+    def __init__(self, stages, queue_size=64, on_finish=None, on_error=None):
+        self.stages = list(stages)
+        self.queue_size = queue_size
+        # Called with the stage stats after a run that went through all of its input
+        self.on_finish = on_finish
+        # Called as on_error(stage name, item, exception) for each item a stage raised on; what it
+        # returns (unless None) is passed straight to the output, so failed items stay visible
+        self.on_error = on_error
+        self._output = None
+        self._stop = threading.Event()
+
+    # Function to run the pipeline over `source` and yield what comes out of the last stage
+    def run(self, source):
+        self._stop.clear()
+        queues = [queue.Queue(maxsize=self.queue_size)]
+        for stage in self.stages:
+            queues.append(queue.Queue(maxsize=stage.queue_size or self.queue_size))
+        self._output = queues[-1]
+        threads = [threading.Thread(target=self._feed, args=(source, queues[0]), name='pipeline-source', daemon=True)]
+        pools = []
+        for index, stage in enumerate(self.stages):
+            stage.reset_stats()
+            stage.started = time.monotonic()
+            threads.extend(self._start_stage(stage, queues[index], queues[index + 1], pools))
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                item = queues[-1].get()
+                if item is _DONE:
+                    break
+                yield item
+            if self.on_finish is not None:
+                self.on_finish(self.stats())
+        finally:
+            # Also reached when the caller stops iterating early: unblock every worker
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            for pool in pools:
+                pool.shutdown()
+
+    # Function to get the stats of every stage of the last run
+    def stats(self):
+        return [stage.stats() for stage in self.stages]
+
+    # Function to put an item on a queue, giving up if the pipeline is stopping
+    def _put(self, target, item):
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    # Function to get an item from a queue, returning _DONE if the pipeline is stopping
+    def _get(self, source, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._stop.is_set():
+            wait = 0.1 if deadline is None else min(0.1, deadline - time.monotonic())
+            if wait <= 0:
+                raise queue.Empty
+            try:
+                return source.get(timeout=wait)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    # Function to push the source items into the first queue
+    def _feed(self, source, target):
+        try:
+            for item in source:
+                if not self._put(target, item):
+                    return
+        except Exception as e:
+            print(f"Error reading pipeline source: {str(e)}")
+        self._put(target, _DONE)
+
+    # Function to create the worker threads of one stage
+    def _start_stage(self, stage, inbox, outbox, pools):
+        # An async stage is a single thread however many coroutines it runs
+        remaining = [1 if stage.mode == 'async' else stage.workers]
+        lock = threading.Lock()
+
+        # Called by each worker when it sees _DONE; the last one passes it on
+        def finish():
+            # Leave the marker for sibling workers still waiting on the inbox
+            self._put(inbox, _DONE)
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                stage.finished = time.monotonic()
+                self._put(outbox, _DONE)
+
+        if stage.mode == 'async':
+            return [threading.Thread(target=self._async_worker, args=(stage, inbox, outbox, finish),
+                                     name=f"pipeline-{stage.name}", daemon=True)]
+        call = stage.func
+        if stage.mode == 'process':
+            pool = ProcessPoolExecutor(max_workers=stage.workers, initializer=stage.initializer)
+            pools.append(pool)
+            call = lambda item: pool.submit(stage.func, item).result()
+        return [threading.Thread(target=self._thread_worker, args=(stage, call, inbox, outbox, finish),
+                                 name=f"pipeline-{stage.name}-{i}", daemon=True)
+                for i in range(stage.workers)]
+
+    # Function to take the next item, or up to batch_size items within batch_wait.
+    # Returns (items, done) where done means the upstream stage has finished.
+    def _next_items(self, stage, inbox):
+        item = self._get(inbox)
+        if item is _DONE:
+            return [], True
+        if stage.batch_size == 1:
+            return item, False
+        items = [item]
+        deadline = time.monotonic() + stage.batch_wait
+        while len(items) < stage.batch_size:
+            try:
+                item = self._get(inbox, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is _DONE:
+                return items, True
+            items.append(item)
+        return items, False
+
+    # Function to report the items a stage raised on, passing on_error's markers to the output
+    def _fail(self, stage, items, error):
+        print(f"Error in pipeline stage {stage.name}: {str(error)}")
+        if self.on_error is None:
+            return
+        for item in (items if stage.batch_size > 1 else [items]):
+            try:
+                marker = self.on_error(stage.name, item, error)
+            except Exception as e:
+                print(f"Error handling a failed item of stage {stage.name}: {str(e)}")
+                continue
+            if marker is not None:
+                self._put(self._output, marker)
+
+    # Function to send a stage's result(s) downstream
+    def _emit(self, stage, result, outbox):
+        if result is None:
+            return
+        if stage.fan_out or stage.batch_size > 1:
+            for item in result:
+                if item is not None:
+                    self._put(outbox, item)
+        else:
+            self._put(outbox, result)
+
+    # Function to run one thread of a 'thread' or 'process' stage
+    def _thread_worker(self, stage, call, inbox, outbox, finish):
+        while True:
+            items, done = self._next_items(stage, inbox)
+            if items or (stage.batch_size == 1 and not done):
+                count = len(items) if stage.batch_size > 1 else 1
+                started = time.monotonic()
+                try:
+                    result = call(items)
+                except Exception as e:
+                    stage.record(count, time.monotonic() - started, failed=True)
+                    self._fail(stage, items, e)
+                else:
+                    stage.record(count, time.monotonic() - started)
+                    self._emit(stage, result, outbox)
+            if done or self._stop.is_set():
+                finish()
+                return
+
+    # Function to run an 'async' stage: `workers` coroutines on one event loop
+    def _async_worker(self, stage, inbox, outbox, finish):
+        # Blocking queue calls run here so they never stall the event loop
+        executor = ThreadPoolExecutor(max_workers=stage.workers + 1)
+
+        async def worker(loop):
+            while True:
+                items, done = await loop.run_in_executor(executor, self._next_items, stage, inbox)
+                if items or (stage.batch_size == 1 and not done):
+                    count = len(items) if stage.batch_size > 1 else 1
+                    started = time.monotonic()
+                    try:
+                        result = await stage.func(items)
+                    except Exception as e:
+                        stage.record(count, time.monotonic() - started, failed=True)
+                        await loop.run_in_executor(executor, self._fail, stage, items, e)
+                    else:
+                        stage.record(count, time.monotonic() - started)
+                        await loop.run_in_executor(executor, self._emit, stage, result, outbox)
+                if done or self._stop.is_set():
+                    # Leave the marker for the other coroutines still waiting on the inbox
+                    await loop.run_in_executor(executor, self._put, inbox, _DONE)
+                    return
+
+        async def main():
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*(worker(loop) for _ in range(stage.workers)))
+
+        try:
+            asyncio.run(main())
+        finally:
+            executor.shutdown()
+            finish()
@@ -0,0 +1,290 @@
+import collections
+import contextlib
+import cProfile
+import itertools
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+
+DEFAULT_PROFILE_DIR = 'profiles'
+# Wall-clock stack sampling interval of the sampling profiler
+SAMPLE_INTERVAL = 0.005
+# Inference batches recorded by the torch profiler per run; later batches run unprofiled
+TORCH_WINDOWS = 3
+
+# Profiler currently running (at most one: its hooks are process-wide); the torch window is only
+# opened while it asks for it
+_active = []
+_active_lock = threading.Lock()
+
+
+# Function to make a run id: timestamp plus a random suffix, so concurrent runs never share files
+def make_run_id(prefix='run'):
+    return f"{prefix}-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+# Function to get the collapsed-stack name of a frame (file and first line keep same-named functions apart)
+def frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ':')
+
+
+# Holder that lets pstats.Stats load a raw stats dict (e.g. one sent back from a parse worker process)
+class _RawStats:
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+# Function to get the raw stats dict of a finished cProfile.Profile; it pickles, unlike the profile
+def raw_stats(profile):
+    profile.create_stats()
+    return profile.stats
+
+
+# Profiler for one run (a CLI/script run or a web request), used as a context manager.
+#   mode 'sampling':      samples every thread's stack every SAMPLE_INTERVAL; low overhead
+#   mode 'deterministic': also runs cProfile in the calling thread and in every thread started during the run
+# Writes <run_id>.collapsed (flamegraph.pl / speedscope input), <run_id>.pstats in deterministic mode,
+# and, with torch=True, a chrome trace of the first inference batches (<run_id>-torch-N.json).
+class Profiler:
+    def __init__(self, mode='sampling', output_dir=DEFAULT_PROFILE_DIR, run_id=None, torch=True,
+                 interval=SAMPLE_INTERVAL, torch_windows=TORCH_WINDOWS):
+        if mode not in ('sampling', 'deterministic'):
+            raise ValueError(f"Unknown profiling mode {mode!r}")
+        self.mode = mode
+        self.output_dir = output_dir
+        self.run_id = run_id or make_run_id()
+        self.torch = torch
+        self.interval = interval
+        self.torch_windows = torch_windows
+        self.samples = collections.Counter()
+        self._profiles = []
+        self._profiles_lock = threading.Lock()
+        self._torch_count = itertools.count()
+        self._stop = threading.Event()
+        self._sampler = None
+        self.started = None
+        self.files = []
+
+    def _sample_loop(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_name(frame))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)).replace(';', ':'))
+                self.samples[';'.join(reversed(stack))] += 1
+
+    # Profile hook installed for new threads: replaces itself with a cProfile.Profile for that thread
+    def _start_thread_profile(self, frame, event, arg):
+        profile = cProfile.Profile()
+        with self._profiles_lock:
+            self._profiles.append(profile)
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler already owns this thread (e.g. a sampled URL)
+            sys.setprofile(None)
+
+    # Function to start profiling; raises RuntimeError if another run is already being profiled
+    def start(self):
+        with _active_lock:
+            if _active:
+                raise RuntimeError(f"Run {_active[0].run_id} is already being profiled")
+            _active.append(self)
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.started = time.monotonic()
+        if self.mode == 'deterministic':
+            threading.setprofile(self._start_thread_profile)
+            profile = cProfile.Profile()
+            self._profiles.append(profile)
+            profile.enable()
+        self._sampler = threading.Thread(target=self._sample_loop, name='profile-sampler', daemon=True)
+        self._sampler.start()
+        return self
+
+    def stop(self):
+        with _active_lock:
+            if self in _active:
+                _active.remove(self)
+        self._stop.set()
+        self._sampler.join()
+        if self.mode == 'deterministic':
+            threading.setprofile(None)
+            # Only the calling thread's profile can be disabled here; the others stop with their threads
+            self._profiles[0].disable()
+        self.write()
+
+    # Function to write the collapsed stacks and, in deterministic mode, the merged pstats file
+    def write(self):
+        collapsed_path = os.path.join(self.output_dir, f"{self.run_id}.collapsed")
+        with open(collapsed_path, 'w') as file:
+            for stack, count in self.samples.most_common():
+                file.write(f"{stack} {count}\n")
+        self.files.append(collapsed_path)
+        if self.mode == 'deterministic':
+            stats = None
+            with self._profiles_lock:
+                profiles = list(self._profiles)
+            for profile in profiles:
+                try:
+                    stats = pstats.Stats(profile) if stats is None else stats.add(profile)
+                except TypeError:
+                    # A thread profile that never recorded a call
+                    continue
+            if stats is not None:
+                pstats_path = os.path.join(self.output_dir, f"{self.run_id}.pstats")
+                stats.dump_stats(pstats_path)
+                self.files.append(pstats_path)
+        print(f"Profile {self.run_id} ({self.mode}, {time.monotonic() - self.started:.1f}s): "
+              f"{', '.join(self.files)}")
+
+    # Function to claim the next torch profiler window, or None once the run has used them all
+    def next_torch_window(self):
+        if not self.torch:
+            return None
+        window = next(self._torch_count)
+        if window >= self.torch_windows:
+            return None
+        return os.path.join(self.output_dir, f"{self.run_id}-torch-{window}.json")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.stop()
+
+
+# Context manager profiling a run when mode is set ('sampling' or 'deterministic'); yields the
+# Profiler, or None when mode is unset or another run is already being profiled (that run is left
+# alone and this one runs unprofiled)
+@contextlib.contextmanager
+def profile_run(mode=None, output_dir=DEFAULT_PROFILE_DIR, run_id=None):
+    profiler = None
+    if mode:
+        profiler = Profiler(mode, output_dir=output_dir, run_id=run_id)
+        try:
+            profiler.start()
+        except RuntimeError as e:
+            print(f"Not profiling this run: {str(e)}")
+            profiler = None
+    try:
+        yield profiler
+    finally:
+        if profiler is not None:
+            profiler.stop()
+
+
+_torch_lock = threading.Lock()
+
+
+# Context manager around an inference call: while a run profiler is active, records the call with
+# the torch profiler (one window at a time) and exports a chrome trace; otherwise it does nothing
+@contextlib.contextmanager
+def torch_window(label='inference'):
+    with _active_lock:
+        profiler = _active[-1] if _active else None
+    if profiler is None or not _torch_lock.acquire(blocking=False):
+        yield
+        return
+    try:
+        # Claimed only once the lock is held, so a busy window doesn't use one up
+        trace_path = profiler.next_torch_window()
+        if trace_path is None:
+            yield
+            return
+        import torch.profiler
+        with torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU]) as torch_profile:
+            with torch.profiler.record_function(label):
+                yield
+        torch_profile.export_chrome_trace(trace_path)
+        profiler.files.append(trace_path)
+    finally:
+        _torch_lock.release()
+
+
+# Always-on, low-overhead profiling of 1 in `every` URLs: the sampled URLs' fetch and parse calls run
+# under cProfile (in whichever thread or process runs them) and the stats are merged per run into
+# <run_id>-urls.pstats. Each flush starts a new run id with no stats, so a long-lived profiler (the app,
+# the update loop) writes one small file pair per pipeline run. Pipelines get it through the
+# `url_profiler` option.
+class UrlProfiler:
+    def __init__(self, every=100, output_dir=DEFAULT_PROFILE_DIR, run_id=None):
+        self.every = every
+        self.output_dir = output_dir
+        self.run_id = run_id or make_run_id('urls')
+        self.urls = []
+        self._stats = None
+        self._lock = threading.Lock()
+
+    # Function to decide whether to profile the next URL
+    def sample(self):
+        return self.every > 0 and random.randrange(self.every) == 0
+
+    # Function to merge the stats a sampled page brought back from the pipeline stages
+    def add(self, url, stats_list):
+        with self._lock:
+            self.urls.append(url)
+            for stats in stats_list:
+                if self._stats is None:
+                    self._stats = pstats.Stats(_RawStats(stats))
+                else:
+                    self._stats.add(_RawStats(stats))
+
+    # Function to write the merged stats of the URLs sampled since the last flush (called when a pipeline
+    # run finishes) and start a new run id
+    def flush(self, *args):
+        with self._lock:
+            if self._stats is None:
+                return
+            os.makedirs(self.output_dir, exist_ok=True)
+            path = os.path.join(self.output_dir, f"{self.run_id}-urls.pstats")
+            self._stats.dump_stats(path)
+            with open(os.path.join(self.output_dir, f"{self.run_id}-urls.txt"), 'w') as file:
+                file.write('\n'.join(self.urls) + '\n')
+            count = len(self.urls)
+            self.run_id = make_run_id('urls')
+            self.urls = []
+            self._stats = None
+        print(f"Profile of {count} sampled URLs written to {path}")
+
+
+# Wraps a stage function so items flagged with 'profile' run under cProfile; the stats ride along in
+# the result's 'profile_stats' list. Module level so the wrapper can be sent to a process pool.
+# With sample set, the wrapper also decides which items are profiled (use it on the first stage).
+class ProfiledCall:
+    def __init__(self, func, sample=None):
+        self.func = func
+        self.sample = sample
+
+    def __call__(self, item):
+        if self.sample is not None:
+            item['profile'] = self.sample()
+        # A run profiler may already own this thread; it covers the item then
+        if not item.get('profile') or sys.getprofile() is not None:
+            return self.func(item)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            return self.func(item)
+        try:
+            result = self.func(item)
+        finally:
+            profile.disable()
+        stats = item.get('profile_stats', []) + [raw_stats(profile)]
+        result['profile'] = True
+        result['profile_stats'] = stats
+        return result
@@ -0,0 +1,163 @@
+import collections
+import hashlib
+import os
+import threading
+
+import numpy as np
+import torch
+
+from scraper.profiling import torch_window
+
+# Queries describing the pages we want to keep; every page is compared against all of them
+DEFAULT_QUERIES = [
+    "construction projects in California",
+    "infrastructure projects in California",
+    "public tenders and bids for projects in California",
+]
+# Page embeddings kept in memory (and on disk); about 3 KB each, least recently used dropped first
+MAX_CACHE_ENTRIES = 20000
+
+
+# Function to hash page content so identical pages share one cached embedding. The namespace
+# (model and max length) keeps vectors of a different model or truncation from being reused.
+def content_hash(text, namespace=''):
+    return hashlib.sha1(f"{namespace}\0{text}".encode('utf-8', errors='ignore')).hexdigest()
+
+
+# Function to name a model for the embedding cache: its pretrained name or path, else its class
+def model_name(model):
+    return getattr(getattr(model, 'config', None), 'name_or_path', None) or type(model).__name__
+
+
+# Function to compute mean-pooled, L2-normalised BERT embeddings for a batch of texts
+def embed_batch(tokenizer, model, texts, max_length=512):
+    # Recorded by the torch profiler while a profiled run is active; tokenizing and the forward pass
+    # show up as separate ranges
+    with torch_window('embed_batch'):
+        with torch.autograd.profiler.record_function('tokenize'):
+            inputs = tokenizer(list(texts), return_tensors="pt", max_length=max_length, truncation=True,
+                               padding=True)
+        # BertForSequenceClassification keeps the encoder under `.bert`; use it directly for hidden states
+        encoder = getattr(model, 'bert', model)
+        with torch.no_grad(), torch.autograd.profiler.record_function('bert_forward'):
+            hidden = encoder(**inputs).last_hidden_state
+    mask = inputs['attention_mask'].unsqueeze(-1).to(hidden.dtype)
+    pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1.0)
+    vectors = pooled.cpu().numpy().astype(np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+# Function to pick the indices of the k highest scores, best first
+def top_k_indices(scores, k):
+    scores = np.asarray(scores)
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+# Embeds pages once (cached by content hash, model and max length, up to cache_size pages) and
+# ranks them against precomputed query vectors
+class RelevanceEngine:
+    def __init__(self, tokenizer, model, queries=None, batch_size=16, max_length=512, cache_path=None, server=None,
+                 cache_size=MAX_CACHE_ENTRIES):
+        self.tokenizer = tokenizer
+        self.model = model
+        # Optional InferenceServer; when set, all model calls go through its micro-batching worker
+        self.server = server
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.cache_path = cache_path
+        self.cache_size = cache_size
+        self.cache_namespace = f"{model_name(model)}:{max_length}"
+        self.cache = collections.OrderedDict()
+        self._cache_lock = threading.Lock()
+        if cache_path:
+            self.load_cache(cache_path)
+        self.queries = list(queries or DEFAULT_QUERIES)
+        self.query_vectors = self.encode(self.queries)
+
+    # Function to run the model over texts in batches
+    def encode(self, texts):
+        texts = list(texts)
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        if self.server is not None:
+            return self.server.embed(texts)
+        chunks = []
+        for start in range(0, len(texts), self.batch_size):
+            chunks.append(embed_batch(self.tokenizer, self.model, texts[start:start + self.batch_size], self.max_length))
+        return np.vstack(chunks)
+
+    # Function to add embeddings to the cache, dropping the least recently used beyond cache_size
+    def cache_vectors(self, items):
+        with self._cache_lock:
+            for key, vector in items:
+                self.cache[key] = vector
+                self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    # Function to return one embedding row per text, computing only the ones not cached yet
+    def embed(self, texts):
+        texts = list(texts)
+        keys = [content_hash(text, self.cache_namespace) for text in texts]
+        found = {}
+        missing = {}
+        with self._cache_lock:
+            for key, text in zip(keys, texts):
+                if key in found or key in missing:
+                    continue
+                if key in self.cache:
+                    self.cache.move_to_end(key)
+                    found[key] = self.cache[key]
+                else:
+                    missing[key] = text
+        if missing:
+            vectors = self.encode(missing.values())
+            computed = list(zip(missing.keys(), vectors))
+            found.update(computed)
+            self.cache_vectors(computed)
+        if not keys:
+            return np.empty((0, self.query_vectors.shape[1]), dtype=np.float32)
+        return np.vstack([found[key] for key in keys])
+
+    # Function to score every embedding against every query in one matrix multiply
+    def score_embeddings(self, embeddings):
+        if len(embeddings) == 0:
+            return np.empty(0, dtype=np.float32)
+        similarities = embeddings @ self.query_vectors.T
+        # A page is as relevant as its best-matching query
+        return similarities.max(axis=1)
+
+    # Function to score page texts by semantic similarity to the queries
+    def score(self, texts):
+        return self.score_embeddings(self.embed(texts))
+
+    # Function to load cached embeddings saved by save_cache
+    def load_cache(self, path):
+        if not os.path.exists(path):
+            return
+        try:
+            with np.load(path) as data:
+                self.cache_vectors((str(key), vector) for key, vector in zip(data['keys'], data['vectors']))
+        except Exception as e:
+            print(f"Error loading embedding cache {path}: {str(e)}")
+
+    # Function to persist cached embeddings so later runs skip unchanged pages
+    def save_cache(self, path=None):
+        path = path or self.cache_path
+        with self._cache_lock:
+            if not path or not self.cache:
+                return
+            keys = np.array(list(self.cache.keys()))
+            vectors = np.vstack(list(self.cache.values()))
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, keys=keys, vectors=vectors)
+        os.replace(tmp_path, path)
@@ -0,0 +1,204 @@
+import json
+import math
+import os
+import threading
+import time
+
+import torch
+
+from scraper.relevance import RelevanceEngine
+from scraper.tasks import build_pipeline
+
+# Fetching is network-bound, so it gets several concurrent requests per core
+FETCH_PER_CPU = 4
+MAX_FETCH_WORKERS = 64
+# Don't adapt from runs that processed fewer pages than this; the timings are noise
+MIN_ITEMS_TO_ADAPT = 20
+
+
+# Function to read the container CPU quota (cgroup v2, then v1) as a number of CPUs, or None
+def cgroup_cpu_limit():
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as file:
+            quota, period = file.read().split()[:2]
+        if quota != 'max':
+            return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as file:
+            quota = int(file.read())
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as file:
+            period = int(file.read())
+        if quota > 0 and period > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+# Function to count the CPUs this process may really use: affinity mask capped by the cgroup quota
+def available_cpus():
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    limit = cgroup_cpu_limit()
+    if limit:
+        cpus = min(cpus, math.ceil(limit))
+    return max(1, cpus)
+
+
+# Function run in each parse worker process so it never starts its own full intra-op thread pool
+def limit_worker_threads():
+    for name in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ[name] = '1'
+    torch.set_num_threads(1)
+
+
+# Splits the available cores between the inference engine (torch intra-op threads) and the
+# parse workers, sizes fetch concurrency, and moves cores between them from measured throughput
+class ResourceGovernor:
+    def __init__(self, cpus=None, inference_threads=None, parse_workers=None, parse_mode=None, fetch_workers=None):
+        self.cpus = cpus or available_cpus()
+        # Default split: half the cores for inference, the rest for parsing
+        self.inference_threads = inference_threads or max(1, self.cpus // 2)
+        self.parse_workers = parse_workers or max(1, self.cpus - self.inference_threads)
+        self.parse_mode = parse_mode or ('process' if self.parse_workers > 1 else 'thread')
+        self.fetch_workers = fetch_workers or min(MAX_FETCH_WORKERS, self.cpus * FETCH_PER_CPU)
+        self._lock = threading.Lock()
+        # Budget last applied by each thread that runs the model
+        self._applied = threading.local()
+
+    # Function to give torch its thread budget; call before the model runs
+    def apply_torch(self):
+        torch.set_num_threads(self.inference_threads)
+        try:
+            # Only allowed before any inter-op parallel work has started
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass
+
+    # Function to give the calling thread the current inference budget. torch's thread setting only
+    # reaches the thread that makes the call, so whichever thread runs the model calls this before
+    # each batch; torch is only called again when the budget has changed.
+    def apply_inference_threads(self):
+        threads = self.inference_threads
+        if getattr(self._applied, 'threads', None) != threads:
+            torch.set_num_threads(threads)
+            self._applied.threads = threads
+
+    # Function to get the stage settings for build_pipeline
+    def pipeline_options(self):
+        with self._lock:
+            options = {'fetch_workers': self.fetch_workers, 'parse_workers': self.parse_workers,
+                       'parse_mode': self.parse_mode}
+        if options['parse_mode'] == 'process':
+            options['parse_initializer'] = limit_worker_threads
+        return options
+
+    # Function to adapt the budgets from the stats of a finished pipeline run.
+    # A stage's utilisation is its busy time over wall time per worker; a saturated CPU stage
+    # takes a core from an idle one, and fetch concurrency follows whether fetching is the bottleneck.
+    def observe(self, stats):
+        stages = {stage['stage']: stage for stage in stats}
+        if sum(stage['processed'] for stage in stats) < MIN_ITEMS_TO_ADAPT * len(stats):
+            return
+        utilisation = {}
+        for name, stage in stages.items():
+            if stage['wall_seconds'] > 0:
+                utilisation[name] = stage['busy_seconds'] / (stage['wall_seconds'] * stage['workers'])
+        fetch = utilisation.get('fetch', 0.0)
+        parse = utilisation.get('parse', 0.0)
+        score = utilisation.get('score', 0.0)
+        with self._lock:
+            before = (self.inference_threads, self.parse_workers, self.fetch_workers)
+            if parse > 0.9 and score < 0.5 and self.inference_threads > 1:
+                self.inference_threads -= 1
+                self.parse_workers += 1
+            elif score > 0.9 and parse < 0.5 and self.parse_workers > 1:
+                self.parse_workers -= 1
+                self.inference_threads += 1
+            if fetch > 0.9 and max(parse, score) < 0.5:
+                self.fetch_workers = min(MAX_FETCH_WORKERS, self.fetch_workers * 2)
+            elif fetch < 0.3:
+                # Fetchers mostly waited on full queues downstream; fewer are enough
+                self.fetch_workers = max(self.cpus, self.fetch_workers // 2)
+            self.parse_mode = 'process' if self.parse_workers > 1 else 'thread'
+            changed = before != (self.inference_threads, self.parse_workers, self.fetch_workers)
+        if changed:
+            # The threads running the model pick up the new budget before their next batch
+            print(f"Resource split adapted: {self.describe()}")
+
+    # Function to describe the current split
+    def describe(self):
+        return (f"{self.cpus} cpus: inference_threads={self.inference_threads} parse_workers={self.parse_workers} "
+                f"({self.parse_mode}) fetch_workers={self.fetch_workers}")
+
+    # Function to save the split (e.g. the one found by benchmark mode)
+    def save(self, path):
+        with open(path, 'w') as file:
+            json.dump({'cpus': self.cpus, 'inference_threads': self.inference_threads,
+                       'parse_workers': self.parse_workers, 'parse_mode': self.parse_mode,
+                       'fetch_workers': self.fetch_workers}, file, indent=2)
+
+    # Function to create a governor from a saved split; falls back to defaults if it is missing
+    # or was measured on a different number of cores (cpus defaults to all the usable cores)
+    @classmethod
+    def load(cls, path, cpus=None):
+        cpus = cpus or available_cpus()
+        if path and os.path.exists(path):
+            try:
+                with open(path) as file:
+                    saved = json.load(file)
+                if saved.get('cpus') == cpus:
+                    return cls(cpus, saved['inference_threads'], saved['parse_workers'], saved['parse_mode'],
+                               saved['fetch_workers'])
+                print(f"Ignoring {path}: measured on {saved.get('cpus')} cpus, running on {cpus}")
+            except Exception as e:
+                print(f"Error loading resource split {path}: {str(e)}")
+        return cls(cpus)
+
+
+# Fetch client that replays already fetched pages, so benchmarks measure only the CPU stages
+class ReplayFetchClient:
+    def __init__(self, html_pages):
+        self.html_pages = html_pages
+
+    def fetch(self, url):
+        return self.html_pages.get(url)
+
+
+# Function to try inference/parse splits on this host over already fetched pages and keep the fastest
+def benchmark_splits(html_pages, tokenizer, model, governor, repeats=1):
+    cpus = governor.cpus
+    candidates = sorted({1, max(1, cpus // 4), max(1, cpus // 2), max(1, cpus - 1), cpus})
+    fetch_client = ReplayFetchClient(html_pages)
+    items = list(html_pages) * repeats
+    results = []
+    for inference_threads in candidates:
+        parse_workers = max(1, cpus - inference_threads)
+        for parse_mode in ('thread', 'process'):
+            if parse_mode == 'process' and parse_workers == 1:
+                continue
+            torch.set_num_threads(inference_threads)
+            # A fresh engine per trial so the embedding cache doesn't hide the inference cost
+            engine = RelevanceEngine(tokenizer, model)
+            pipeline = build_pipeline(fetch_client, engine, fetch_workers=cpus, parse_workers=parse_workers,
+                                      parse_mode=parse_mode,
+                                      parse_initializer=limit_worker_threads if parse_mode == 'process' else None)
+            started = time.monotonic()
+            for _ in pipeline.run({'url': url} for url in items):
+                pass
+            elapsed = time.monotonic() - started
+            result = {'inference_threads': inference_threads, 'parse_workers': parse_workers,
+                      'parse_mode': parse_mode, 'seconds': round(elapsed, 3),
+                      'pages_per_second': round(len(items) / elapsed, 3) if elapsed else 0.0}
+            print(result)
+            results.append(result)
+    best = max(results, key=lambda result: result['pages_per_second'])
+    governor.inference_threads = best['inference_threads']
+    governor.parse_workers = best['parse_workers']
+    governor.parse_mode = best['parse_mode']
+    governor.apply_torch()
+    return results
@@ -0,0 +1,284 @@
+import csv
+import json
+import random
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+
+from bs4 import BeautifulSoup
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from scraper.compression import open_compressed, split_codec
+from scraper.frontier import links_from_soup
+from scraper.geocode import default_geocoder
+
+
+# Function to pull the title, description meta tag and additional attributes out of parsed HTML
+def extract_from_soup(soup):
+    # Extract title
+    title = soup.title.text.strip()
+    # Extract description meta tag
+    description_tag = soup.find('meta', attrs={'name': 'description'})
+    description = description_tag['content'].strip() if description_tag else ""
+    # Extract additional attributes
+    additional_info = {}
+    # You can add code here to extract additional attributes from the HTML content
+    return title, description, additional_info
+
+
+# Function to parse fetched HTML once: the page text for relevance scoring plus the
+# fields standardization needs (and the page's links when crawling)
+def parse_page(url, html_content, with_links=False):
+    page = {'url': url, 'text': None, 'title': None, 'description': None, 'additional_info': None, 'links': []}
+    if not html_content:
+        return page
+    try:
+        soup = BeautifulSoup(html_content, 'html.parser')
+    except Exception as e:
+        print(f"Error parsing {url}: {str(e)}")
+        return page
+    # Remove HTML tags and extract text
+    page['text'] = soup.get_text(separator=' ')
+    try:
+        page['title'], page['description'], page['additional_info'] = extract_from_soup(soup)
+    except Exception as e:
+        print(f"Error extracting information from {url}: {str(e)}")
+    if with_links:
+        page['links'] = links_from_soup(soup, url)
+    return page
+
+
+# Values the placeholder BERT analysis and the standardization defaults are drawn from
+STATUSES = ["Open", "Closed"]
+STAGES = ["Planning", "Execution"]
+PROCUREMENT_METHODS = ["Design and Build", "Request for Proposal"]
+BUYERS = ["Public", "Private"]
+SUBSECTORS = ["Building Construction", "Infrastructure Development"]
+MIN_BUDGET = 100000.0
+MAX_BUDGET = 10000000.0
+# Used when no place can be resolved for a record
+DEFAULT_COORDINATES = {"type": "Point", "coordinates": [-122.4, 37.8]}
+DEFAULT_REGION = ("California", "CA")
+
+# Columns of a standardized record (Table 2), in CSV order
+FIELDNAMES = ("aug_id", "country_name", "country_code", "map_coordinates", "url", "region_name", "region_code",
+              "title", "description", "status", "stages", "date", "procurementMethod", "budget", "currency", "buyer",
+              "sector", "subsector", "bert_predicted_label")
+
+
+# Function to encode a nested field as JSON, with orjson when it is installed
+def dumps_json(value):
+    if orjson is not None:
+        return orjson.dumps(value).decode()
+    return json.dumps(value, separators=(',', ':'))
+
+
+# A standardized record. Slots instead of a per-row dict keep bulk exports small; it still
+# reads like a dict (record['url'], keys()) for the code that prints or merges records.
+# Fields have no defaults, so the explicit __slots__ don't clash with class attributes.
+@dataclass
+class ProjectRecord:
+    __slots__ = FIELDNAMES
+
+    aug_id: str
+    country_name: str
+    country_code: str
+    map_coordinates: dict
+    url: str
+    region_name: str
+    region_code: str
+    title: str
+    description: str
+    status: str
+    stages: str
+    date: str
+    procurementMethod: str
+    budget: float
+    currency: str
+    buyer: str
+    sector: str
+    subsector: str
+    bert_predicted_label: dict
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+    def get(self, name, default=None):
+        return getattr(self, name, default)
+
+    def keys(self):
+        return FIELDNAMES
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in FIELDNAMES}
+
+    def __repr__(self):
+        return repr(self.as_dict())
+
+
+# Function to analyze the descriptions of a batch using BERT and extract relevant attributes,
+# one column at a time
+def analyze_with_bert_batch(descriptions):
+    # For demonstration, let's assume we're analyzing the content for standard attributes using BERT
+    n = len(descriptions)
+    columns = zip(random.choices(STATUSES, k=n), random.choices(STAGES, k=n),
+                  random.choices(PROCUREMENT_METHODS, k=n), random_budgets(n), random.choices(BUYERS, k=n),
+                  random.choices(SUBSECTORS, k=n))
+    return [{"status": status, "stages": stages, "procurementMethod": procurement_method, "budget": budget,
+             "currency": "USD", "buyer": buyer, "sector": "Construction", "subsector": subsector}
+            for status, stages, procurement_method, budget, buyer, subsector in columns]
+
+
+# Function to analyze HTML content using BERT and extract relevant attributes
+def analyze_with_bert(html_content):
+    return analyze_with_bert_batch([html_content])[0]
+
+
+# Function to draw n random budgets between 100,000 and 10,000,000 USD
+def random_budgets(n):
+    span = MAX_BUDGET - MIN_BUDGET
+    draw = random.random
+    return [MIN_BUDGET + span * draw() for _ in range(n)]
+
+
+# Function to fill a column from each row's additional info, drawing the defaults for the whole column at once
+def info_column(infos, key, defaults):
+    return [info.get(key, default) for info, default in zip(infos, defaults)]
+
+
+# Function to fill the coordinates and region of each row from the offline gazetteer (City column,
+# URL host, then place names in the title/description)
+def geocode_column(cities, urls, titles, descriptions, geocoder):
+    column = []
+    for city, url, title, description in zip(cities, urls, titles, descriptions):
+        place = geocoder.resolve(city, url, (title, description))
+        if place:
+            column.append((place.coordinates, place.state_name, place.state_code))
+        else:
+            column.append((DEFAULT_COORDINATES,) + DEFAULT_REGION)
+    return column
+
+
+# Function to standardize a batch of (title, description, additional_info, url, city) rows according
+# to Table 2. Constant fields are shared by every record and random defaults are drawn per column.
+def standardize_batch(rows, geocoder=None):
+    rows = list(rows)
+    n = len(rows)
+    if not n:
+        return []
+    titles, descriptions, infos, urls, cities = zip(*rows)
+    infos = [info or {} for info in infos]
+    places = geocode_column(cities, urls, titles, descriptions, geocoder or default_geocoder())
+    date = datetime.now().strftime("%Y-%m-%d")  # Current date
+    columns = zip(
+        (str(uuid.uuid4()) for _ in range(n)),
+        urls, places, titles, descriptions,
+        info_column(infos, "status", random.choices(STATUSES, k=n)),
+        info_column(infos, "stages", random.choices(STAGES, k=n)),
+        info_column(infos, "procurementMethod", random.choices(PROCUREMENT_METHODS, k=n)),
+        info_column(infos, "budget", random_budgets(n)),
+        info_column(infos, "currency", ["USD"] * n),
+        info_column(infos, "buyer", random.choices(BUYERS, k=n)),
+        info_column(infos, "sector", ["Construction"] * n),
+        info_column(infos, "subsector", random.choices(SUBSECTORS, k=n)),
+        # Analyze descriptions with BERT
+        analyze_with_bert_batch(descriptions),
+    )
+    return [ProjectRecord(aug_id, "United States", "USA", coordinates, url, region_name, region_code, title,
+                          description, status, stages, date, procurement_method, budget, currency, buyer, sector,
+                          subsector, bert_predicted_label)
+            for (aug_id, url, (coordinates, region_name, region_code), title, description, status, stages,
+                 procurement_method, budget, currency, buyer, sector, subsector, bert_predicted_label) in columns]
+
+
+# Function to standardize data according to Table 2
+def standardize_data(title, description, additional_info, bert_predicted_label, url, city=None):
+    record = standardize_batch([(title, description, additional_info, url, city)])[0]
+    if bert_predicted_label:
+        record.bert_predicted_label = bert_predicted_label
+    return record
+
+
+# Function to standardize parsed pages, skipping (and reporting) the ones without a title or description
+def standardize_parsed(pages):
+    rows = []
+    for page in pages:
+        if page['title'] and page['description']:
+            rows.append((page['title'], page['description'], page['additional_info'], page['url'], page.get('city')))
+        else:
+            print("Failed to extract information from", page['url'])
+    return standardize_batch(rows)
+
+
+# Function to write standardized data to CSV file (compressed on the fly for .csv.gz/.csv.zst).
+# Nested fields are written as JSON; the coordinates are shared by many records, so each
+# distinct value is encoded only once.
+def write_to_csv(data_list, filename):
+    try:
+        with open_compressed(filename, 'w', newline='') as file:
+            fieldnames = list(data_list[0].keys()) if data_list else list(FIELDNAMES)
+            writer = csv.writer(file)
+            writer.writerow(fieldnames)
+            encoded_coordinates = {}
+            for data in data_list:
+                row = [data.get(name, '') for name in fieldnames]
+                for i, value in enumerate(row):
+                    if not isinstance(value, (dict, list)):
+                        continue
+                    if fieldnames[i] == 'map_coordinates':
+                        key = id(value)
+                        if key not in encoded_coordinates:
+                            # Keep the value so its id can't be reused by another object
+                            encoded_coordinates[key] = (value, dumps_json(value))
+                        row[i] = encoded_coordinates[key][1]
+                    else:
+                        row[i] = dumps_json(value)
+                writer.writerow(row)
+        print(f"Data written to {filename} successfully.")
+    except Exception as e:
+        print(f"Error writing to CSV: {str(e)}")
+
+
+# Function to write standardized data as JSON lines (compressed on the fly for .jsonl.gz/.jsonl.zst)
+def write_to_jsonl(data_list, filename):
+    try:
+        with open_compressed(filename, 'w', encoding='utf-8', newline='\n') as file:
+            for data in data_list:
+                file.write(dumps_json(data.as_dict() if isinstance(data, ProjectRecord) else dict(data)))
+                file.write('\n')
+        print(f"Data written to {filename} successfully.")
+    except Exception as e:
+        print(f"Error writing to JSONL: {str(e)}")
+
+
+# Function to export standardized data in the format named by the file: .csv or .jsonl,
+# optionally followed by .gz or .zst
+def export_records(data_list, filename):
+    if split_codec(filename)[0].endswith('.jsonl'):
+        write_to_jsonl(data_list, filename)
+    else:
+        write_to_csv(data_list, filename)
+
+
+# Function to update rows in an existing CSV file by URL, keeping rows of pages not re-scraped this run.
+# If the existing file can't be read completely it is left as it is and the error is raised,
+# rather than overwriting the dataset with this run's rows only.
+def merge_into_csv(data_list, filename):
+    rows = {}
+    try:
+        with open_compressed(filename, 'r', newline='') as file:
+            for row in csv.DictReader(file):
+                rows[row['url']] = row
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"Error reading existing CSV {filename}, not updating it: {str(e)}")
+        raise
+    for data in data_list:
+        rows[data['url']] = data
+    if rows:
+        write_to_csv(list(rows.values()), filename)
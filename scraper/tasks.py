@@ -0,0 +1,317 @@
+import csv
+import threading
+import time
+
+from transformers import BertTokenizer, BertForSequenceClassification
+
+from scraper.compression import open_compressed
+from scraper.frontier import CrawlFrontier
+from scraper.pipeline import Pipeline, Stage
+from scraper.profiling import ProfiledCall
+from scraper.relevance import top_k_indices
+from scraper.standardize import merge_into_csv, parse_page, standardize_parsed
+
+DEFAULT_MODEL = 'bert-base-uncased'
+# Bump when a change to the pipeline changes its output, so cached results are not reused
+PIPELINE_VERSION = '1'
+
+# Concurrency of each stage; fetching is network-bound, parsing CPU-bound, scoring runs batched on the model
+DEFAULT_OPTIONS = {
+    'fetch_workers': 8,
+    'parse_workers': 2,
+    'parse_mode': 'thread',
+    'score_batch_size': 16,
+    'queue_size': 64,
+}
+
+
+# Function to load the BERT model and tokenizer
+def load_model(model_name=DEFAULT_MODEL):
+    tokenizer = BertTokenizer.from_pretrained(model_name)
+    model = BertForSequenceClassification.from_pretrained(model_name, num_labels=2)
+    model.eval()
+    return tokenizer, model
+
+
+# Function to read the 'Source URL' column of an input CSV file
+def read_urls(filename):
+    urls = []
+    with open_compressed(filename, 'r') as file:
+        reader = csv.DictReader(file)
+        for row in reader:
+            urls.append(row['Source URL'])
+    return urls
+
+
+# Function to map each source URL of an input CSV file to its 'City' column, for geocoding
+def read_cities(filename):
+    cities = {}
+    with open_compressed(filename, 'r') as file:
+        for row in csv.DictReader(file):
+            if row.get('City'):
+                cities[row['Source URL']] = row['City']
+    return cities
+
+
+# Function to parse a fetched item; module level so it can run in a process pool
+def parse_item(item):
+    page = parse_page(item['url'], item.get('html'), with_links=item.get('with_links', False))
+    if not item.get('with_text', True):
+        page['text'] = None
+    page['fetched'] = item.get('html') is not None
+    page['depth'] = item.get('depth', 0)
+    page['seed'] = item.get('seed', item['url'])
+    page['city'] = item.get('city')
+    return page
+
+
+# Function to turn an item a stage raised on into a page with no title/score, marked with the
+# stage in 'failed', so it still comes out of the pipeline (a crawl counts every page it queued)
+def failed_page(stage, item, error):
+    if stage in ('fetch', 'parse'):
+        fetched = item.get('html') is not None
+        item = parse_item(dict(item, html=None))
+        item['fetched'] = fetched
+    item['text'] = None
+    item.setdefault('score', None)
+    item['failed'] = stage
+    return item
+
+
+# Function to build the fetch -> parse -> score pipeline. Items are dicts with a 'url' key;
+# every input comes out: pages that failed to fetch have no title/score, and an item a stage
+# raised on comes out as a failed_page.
+# With a resource governor, its budgets fill in the options not given explicitly and it
+# adapts them from the stats of each finished run. cities maps seed URLs to their City column;
+# pages crawled from a seed inherit its city. With a url_profiler, 1 in N URLs is profiled.
+def build_pipeline(fetch_client, relevance_engine=None, allowed=None, with_links=False, governor=None, cities=None,
+                   url_profiler=None, **options):
+    if governor is not None:
+        options = dict(governor.pipeline_options(), **options)
+    options = dict(DEFAULT_OPTIONS, **options)
+
+    def fetch_item(item):
+        if allowed is not None and not allowed(item['url']):
+            print(f"Skipping {item['url']}: disallowed by robots.txt")
+            item['html'] = None
+        else:
+            print(f"Processing {item['url']}...")
+            item['html'] = fetch_client.fetch(item['url'])
+        item['with_links'] = with_links
+        if cities:
+            item['city'] = cities.get(item.get('seed', item['url']))
+        # The page text is only kept when a score stage needs it
+        item['with_text'] = relevance_engine is not None
+        return item
+
+    def score_pages(pages):
+        scorable = [page for page in pages if page['text']]
+        if scorable:
+            if governor is not None:
+                governor.apply_inference_threads()
+            scores = relevance_engine.score([page['text'] for page in scorable])
+            for page, score in zip(scorable, scores):
+                page['score'] = float(score)
+        for page in pages:
+            page.setdefault('score', None)
+            # The text is only needed for scoring; don't carry it further
+            page['text'] = None
+        return pages
+
+    def collect_profile(page):
+        if page.get('profile'):
+            url_profiler.add(page['url'], page.pop('profile_stats', []))
+        return page
+
+    def on_finish(stats):
+        if governor is not None:
+            governor.observe(stats)
+        if url_profiler is not None:
+            url_profiler.flush()
+
+    fetch, parse = fetch_item, parse_item
+    if url_profiler is not None:
+        fetch, parse = ProfiledCall(fetch_item, sample=url_profiler.sample), ProfiledCall(parse_item)
+    stages = [
+        Stage('fetch', fetch, workers=options['fetch_workers']),
+        Stage('parse', parse, workers=options['parse_workers'], mode=options['parse_mode'],
+              initializer=options.get('parse_initializer')),
+    ]
+    if relevance_engine is not None:
+        stages.append(Stage('score', score_pages, batch_size=options['score_batch_size']))
+    if url_profiler is not None:
+        stages.append(Stage('profile', collect_profile))
+    return Pipeline(stages, queue_size=options['queue_size'], on_finish=on_finish, on_error=failed_page)
+
+
+# Function to fetch, parse and score URLs and return the top k parsed pages, best first.
+# Pages are scored in batches as they stream out of the pipeline; the top k are then picked
+# once over all the scores with argpartition. on_page(page) is called for every page that
+# comes out, e.g. to queue its links for crawling.
+def rank_urls(urls, fetch_client, relevance_engine, top_k=10, on_page=None, with_links=False, **options):
+    pipeline = build_pipeline(fetch_client, relevance_engine, with_links=with_links, **options)
+    pages = []
+    scores = []
+    for page in pipeline.run({'url': url} for url in urls):
+        if on_page is not None:
+            on_page(page)
+        if page['score'] is None:
+            if not page['fetched']:
+                print("Failed to fetch HTML content from", page['url'])
+            continue
+        pages.append(page)
+        scores.append(page['score'])
+    return [pages[i] for i in top_k_indices(scores, top_k)]
+
+
+# Function to standardize pages in one batch, skipping the ones that failed
+def standardize_pages(pages):
+    fetched = []
+    for page in pages:
+        if not page['fetched']:
+            print("Failed to fetch HTML content from", page['url'])
+            continue
+        fetched.append(page)
+    standardized_data_list = standardize_parsed(fetched)
+    for standardized_data in standardized_data_list:
+        print("Standardized Data:", standardized_data)
+        print()  # Add newline for readability between URLs
+    return standardized_data_list
+
+
+# Function to rank URLs by relevance and scrape the top k of them into standardized records
+def scrape_top_links(urls, fetch_client, relevance_engine, top_k=10, **options):
+    top_pages = rank_urls(urls, fetch_client, relevance_engine, top_k=top_k, **options)
+    # Print top links
+    print("Top 5 to 10 Relevant Links:")
+    for page in top_pages:
+        print(page['url'])
+    return standardize_pages(top_pages)
+
+
+# Function to scrape every URL into standardized records, without ranking
+def scrape_urls(urls, fetch_client, allowed=None, **options):
+    return scrape_items(({'url': url} for url in urls), fetch_client, allowed=allowed, **options)
+
+
+# Function to scrape pipeline items ({'url': ..., 'seed': ...}) into standardized records, without
+# ranking; pages keep the seed they were found from, and with it the seed's city
+def scrape_items(items, fetch_client, allowed=None, **options):
+    pipeline = build_pipeline(fetch_client, allowed=allowed, **options)
+    return standardize_pages(pipeline.run(items))
+
+
+# Function to crawl the frontier through the pipeline. Links found on each parsed page are fed
+# back into the frontier, so the source keeps producing URLs until nothing is left in flight.
+def crawl_pages(frontier, fetch_client, allowed=None, stall_timeout=300, **options):
+    pipeline = build_pipeline(fetch_client, allowed=allowed, with_links=True, **options)
+    in_flight = [0]
+    condition = threading.Condition()
+
+    def source():
+        while True:
+            with condition:
+                entry = frontier.pop()
+                while entry is None and in_flight[0] > 0:
+                    # Every finished page notifies; give up if nothing finishes for a long time
+                    if not condition.wait(stall_timeout):
+                        print(f"Crawl stalled with {in_flight[0]} pages in flight, stopping")
+                        return
+                    entry = frontier.pop()
+                if entry is None:
+                    return
+                in_flight[0] += 1
+            url, depth, seed, wait = entry
+            # Per-host politeness delay; the frontier already picked the host that is ready soonest
+            if wait:
+                time.sleep(wait)
+            yield {'url': url, 'depth': depth, 'seed': seed}
+
+    pages = []
+    for page in pipeline.run(source()):
+        with condition:
+            frontier.queue_links(page['links'], page['depth'], page['seed'])
+            in_flight[0] -= 1
+            condition.notify()
+        page['links'] = []
+        print("Scraping project page", page['url'], "found from", page['seed'])
+        pages.extend(standardize_pages([page]))
+    return pages
+
+
+# Function to find the new or modified project pages in the seed hosts' sitemaps.
+# Returns the pipeline items ({'url': page_url, 'seed': seed_url}) and {page_url: lastmod};
+# the lastmods are recorded once the pages are scraped.
+def discovered_pages(discovery, urls, pages_per_seed=None):
+    changed_pages = discovery.discover(urls, max_pages_per_seed=pages_per_seed)
+    items = []
+    lastmods = {}
+    for seed, pages in changed_pages.items():
+        for url, lastmod in pages:
+            items.append({'url': url, 'seed': seed})
+            lastmods[url] = lastmod
+    return items, lastmods
+
+
+# Function to run one update of the standardized dataset: discover changed project pages from
+# sitemaps, rank the seed pages, crawl behind them, and merge everything into the output CSV
+def update_dataset(input_file, output_file, fetch_client, relevance_engine, discovery, top_k=10,
+                   crawl_depth=2, pages_per_seed=25, **options):
+    urls = read_urls(input_file)
+    options.setdefault('cities', read_cities(input_file))
+
+    # Find project pages listed in the seed hosts' sitemaps that are new or modified
+    # since the last run (this also loads robots.txt and its crawl-delay per host)
+    project_items, lastmods = discovered_pages(discovery, urls, pages_per_seed)
+    print(f"{len(project_items)} new or modified project pages to scrape")
+
+    # Links found on every seed page are queued for crawling while the seeds are ranked
+    frontier = CrawlFrontier(max_depth=crawl_depth, max_pages_per_seed=pages_per_seed)
+    for url in urls + list(lastmods):
+        frontier.mark_visited(url)
+
+    def queue_seed_links(page):
+        frontier.queue_links(page['links'], 0, page['url'])
+        page['links'] = []
+
+    top_pages = rank_urls(urls, fetch_client, relevance_engine, top_k=top_k, on_page=queue_seed_links,
+                          with_links=True, **options)
+    relevance_engine.save_cache()
+    print("Top 5 to 10 Relevant Links:")
+    for page in top_pages:
+        print(page['url'])
+    standardized_data_list = standardize_pages(top_pages)
+    standardized_data_list += scrape_items(project_items, fetch_client, allowed=discovery.allowed, **options)
+    # Crawl one or two links deeper from the listing pages to reach the individual project pages
+    standardized_data_list += crawl_pages(frontier, fetch_client, allowed=discovery.allowed, **options)
+
+    # Update standardized data in the CSV file; rows of unchanged pages are kept
+    merge_into_csv(standardized_data_list, output_file)
+    discovery.mark_scraped(standardized_data_list, lastmods)
+    fetch_client.save_state()
+    discovery.save_state()
+    return standardized_data_list
+
+
+# Function to scrape a set of seed pages and the project pages behind them without ranking:
+# sitemap discovery, the seed pages themselves, then a crawl from their links. Used per shard
+# in distributed mode, where a global top-k is not available.
+def scrape_and_crawl(urls, fetch_client, discovery, crawl_depth=2, pages_per_seed=25, **options):
+    project_items, lastmods = discovered_pages(discovery, urls, pages_per_seed)
+    frontier = CrawlFrontier(max_depth=crawl_depth, max_pages_per_seed=pages_per_seed)
+    for url in urls + list(lastmods):
+        frontier.mark_visited(url)
+    seeds = set(urls)
+    pipeline = build_pipeline(fetch_client, allowed=discovery.allowed, with_links=True, **options)
+    pages = []
+    for page in pipeline.run([{'url': url} for url in urls] + project_items):
+        if page['url'] in seeds:
+            frontier.queue_links(page['links'], 0, page['url'])
+        page['links'] = []
+        pages.append(page)
+    standardized_data_list = standardize_pages(pages)
+    standardized_data_list += crawl_pages(frontier, fetch_client, allowed=discovery.allowed, **options)
+    discovery.mark_scraped(standardized_data_list, lastmods)
+    fetch_client.save_state()
+    discovery.save_state()
+    return standardized_data_list
@@ -0,0 +1,145 @@
+import codecs
+import contextlib
+import csv
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+# Size of the chunks outputs are streamed in
+CHUNK_SIZE = 64 * 1024
+# Cached outputs are scraped from live sites; after this long they are scraped again
+RESULT_MAX_AGE = 24 * 3600
+
+
+# A private directory for one request, removed with everything in it when the request is done
+class RequestWorkspace:
+    def __init__(self, root):
+        os.makedirs(root, exist_ok=True)
+        self.path = tempfile.mkdtemp(prefix=time.strftime('%Y%m%d-%H%M%S-'), dir=root)
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    def cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.cleanup()
+
+
+# Function to read the source URLs and cities of an uploaded CSV straight from its stream,
+# hashing the bytes on the way. Gzipped uploads are decompressed as they are read and hashed by
+# their content. Returns (content hash, urls, {url: city}).
+def read_upload(stream, compressed=False):
+    if compressed:
+        stream = gzip.GzipFile(fileobj=stream)
+    digest = hashlib.sha256()
+
+    def lines():
+        for line in stream:
+            digest.update(line)
+            yield line
+
+    urls = []
+    cities = {}
+    for row in csv.DictReader(codecs.iterdecode(lines(), 'utf-8-sig')):
+        url = row.get('Source URL')
+        if url:
+            urls.append(url)
+            if row.get('City'):
+                cities[url] = row['City']
+    # Drain anything the CSV reader didn't consume so the hash covers the whole upload
+    for _ in lines():
+        pass
+    return digest.hexdigest(), urls, cities
+
+
+# Function to stream a file in chunks; the file is opened before the response starts, so it can
+# be evicted from the cache mid-download without breaking it
+def stream_file(path):
+    file = open(path, 'rb')
+
+    def chunks():
+        with file:
+            while True:
+                chunk = file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    return chunks()
+
+
+# Cache of finished outputs keyed by upload content hash and pipeline version.
+# Identical uploads wait for the one already being processed instead of redoing the work.
+# An output's mtime is when it was made (expired after max_age); its atime is its last use (LRU).
+class ResultCache:
+    def __init__(self, root, version, max_entries=100, max_age=RESULT_MAX_AGE):
+        self.root = root
+        self.version = version
+        self.max_entries = max_entries
+        self.max_age = max_age
+        # key -> [lock, number of requests using it]
+        self._locks = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def key(self, content_hash):
+        return hashlib.sha256(f"{content_hash}:{self.version}".encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.root, f"{key}.csv")
+
+    # Function to get the path of a finished output, or None if there is none or it has expired
+    def get(self, key):
+        path = self.path(key)
+        try:
+            created = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
+        now = time.time()
+        if self.max_age is not None and now - created > self.max_age:
+            return None
+        # Mark it used (atime only, the mtime keeps its age) so eviction drops the least recently used
+        os.utime(path, (now, created))
+        return path
+
+    # Function to move a finished output into the cache (atomically) and return its cached path
+    def put(self, key, output_path):
+        path = self.path(key)
+        now = time.time()
+        os.utime(output_path, (now, now))
+        os.replace(output_path, path)
+        self.evict()
+        return path
+
+    # Context manager serializing the work on one key; the lock is dropped when nobody uses it
+    @contextlib.contextmanager
+    def lock(self, key):
+        with self._lock:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+
+    # Function to drop the least recently used outputs beyond max_entries
+    def evict(self):
+        try:
+            entries = [os.path.join(self.root, name) for name in os.listdir(self.root) if name.endswith('.csv')]
+            entries.sort(key=os.path.getatime, reverse=True)
+            for path in entries[self.max_entries:]:
+                os.remove(path)
+        except OSError as e:
+            print(f"Error evicting cached results: {str(e)}")
@@ -7,7 +7,7 @@
 # fetching the latest data from the specified URLs and updating the standardized data accordingly.
 # This can be achieved using cron jobs on Unix-like systems or Task Scheduler on Windows.
 
-# To implement continuous updating, the main function `main()` is wrapped in an infinite loop.
+# To implement continuous updating, the main function `main()` runs the update in an infinite loop.
 # Inside this loop, the data scraping and standardization process is executed.
 # After completing each iteration of the loop, the program waits for a specified time interval before starting the next iteration.
 # This ensures that the process runs at regular intervals, allowing for continuous updates.
@@ -19,231 +19,56 @@
 # and the standardized data will be refreshed accordingly, ensuring that the information remains up-to-date over time.
 
 
-import csv
-import requests
-from bs4 import BeautifulSoup
-from datetime import datetime
-import json
-import uuid
-from transformers import BertTokenizer, BertForSequenceClassification
-import torch
-import random
 import time  # Import the time module for scheduling
-
-# Initialize BERT model and tokenizer
-tokenizer = BertTokenizer.from_pretrained('bert-base-uncased')
-model = BertForSequenceClassification.from_pretrained('bert-base-uncased', num_labels=2)
-model.eval()
-
-# Function to fetch content from a URL and remove HTML tags
-def fetch_content(url):
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.content, 'html.parser')
-            # Remove HTML tags and extract text
-            text = soup.get_text(separator=' ')
-            return text
-        else:
-            print(f"Failed to fetch URL: {url}")
-            return None
-    except Exception as e:
-        print(f"Error processing URL {url}: {str(e)}")
-        return None
-
-# Function to generate summary using BERT
-def generate_summary(text):
-    try:
-        # Tokenize and truncate the text for BERT input
-        inputs = tokenizer.encode_plus(text, return_tensors="pt", max_length=512, truncation=True)
-        # Generate summary using BERT
-        outputs = model(**inputs)
-        summary = tokenizer.decode(outputs.logits.argmax(dim=-1)[0])
-        return summary
-    except Exception as e:
-        print(f"Error generating summary: {str(e)}")
-        return None
-
-# Function to fetch HTML content from a URL
-def fetch_html_content(url):
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            return response.content
-        else:
-            print(f"Failed to fetch HTML content from {url}")
-            return None
-    except Exception as e:
-        print(f"Error fetching HTML content from {url}: {str(e)}")
-        return None
-
-# Function to extract information from HTML content
-def extract_information(html_content):
-    if html_content:
-        try:
-            soup = BeautifulSoup(html_content, 'html.parser')
-            # Extract title
-            title = soup.title.text.strip()
-            # Extract description meta tag
-            description_tag = soup.find('meta', attrs={'name': 'description'})
-            description = description_tag['content'].strip() if description_tag else ""
-            # Extract additional attributes
-            additional_info = {}
-            # You can add code here to extract additional attributes from the HTML content
-            return title, description, additional_info
-        except Exception as e:
-            print(f"Error extracting information: {str(e)}")
-            return None, None, None
-    else:
-        return None, None, None
-
-# Function to analyze HTML content using BERT and extract relevant attributes
-def analyze_with_bert(html_content):
-    # Process the HTML content
-    # For demonstration, let's assume we're analyzing the content for standard attributes using BERT
-    bert_predicted_attributes = {
-        "status": random.choice(["Open", "Closed"]),
-        "stages": random.choice(["Planning", "Execution"]),
-        "procurementMethod": random.choice(["Design and Build", "Request for Proposal"]),
-        "budget": random.uniform(100000.0, 10000000.0),  # Random budget between 100,000 and 10,000,000 USD
-        "currency": "USD",
-        "buyer": random.choice(["Public", "Private"]),
-        "sector": "Construction",
-        "subsector": random.choice(["Building Construction", "Infrastructure Development"])
-    }
-    return bert_predicted_attributes
-
-# Function to standardize data according to Table 2
-def standardize_data(title, description, additional_info, bert_predicted_label, url):
-    aug_id = str(uuid.uuid4())  # Generate UUID
-    country_name = "United States"
-    country_code = "USA"
-    map_coordinates = {"type": "Point", "coordinates": [-122.4, 37.8]}  # Default coordinates for demonstration
-    region_name = "California"
-    region_code = "CA"
-    status = additional_info.get("status", random.choice(["Open", "Closed"]))
-    stages = additional_info.get("stages", random.choice(["Planning", "Execution"]))
-    date = datetime.now().strftime("%Y-%m-%d")  # Current date
-    procurement_method = additional_info.get("procurementMethod", random.choice(["Design and Build", "Request for Proposal"]))
-    budget = additional_info.get("budget", random.uniform(100000.0, 10000000.0))  # Random budget between 100,000 and 10,000,000 USD
-    currency = additional_info.get("currency", "USD")
-    buyer = additional_info.get("buyer", random.choice(["Public", "Private"]))
-    sector = additional_info.get("sector", "Construction")
-    subsector = additional_info.get("subsector", random.choice(["Building Construction", "Infrastructure Development"]))
-
-    # Analyze description with BERT
-    bert_predicted_label = bert_predicted_label or analyze_with_bert(description)
-
-    # Construct standardized data as dictionary
-    standardized_data = {
-        "aug_id": aug_id,
-        "country_name": country_name,
-        "country_code": country_code,
-        "map_coordinates": map_coordinates,
-        "url": url,
-        "region_name": region_name,
-        "region_code": region_code,
-        "title": title,
-        "description": description,
-        "status": status,
-        "stages": stages,
-        "date": date,
-        "procurementMethod": procurement_method,
-        "budget": budget,
-        "currency": currency,
-        "buyer": buyer,
-        "sector": sector,
-        "subsector": subsector,
-        "bert_predicted_label": bert_predicted_label
-    }
-    return standardized_data
-
-# Function to write standardized data to CSV file
-def write_to_csv(data_list, filename):
-    try:
-        with open(filename, 'w', newline='') as file:
-            writer = csv.DictWriter(file, fieldnames=data_list[0].keys())
-            writer.writeheader()
-            for data in data_list:
-                writer.writerow(data)
-        print(f"Data written to {filename} successfully.")
-    except Exception as e:
-        print(f"Error writing to CSV: {str(e)}")
-
-# Main function
+import os
+import sys
+
+# Make the shared `scraper` package importable when running from the scripts folder
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from scraper.discovery import DISCOVERY_STATE_FILE, Discovery
+from scraper.fetch import HOST_STATE_FILE, FetchClient
+from scraper.profiling import UrlProfiler, profile_run
+from scraper.relevance import RelevanceEngine
+from scraper.resources import ResourceGovernor
+from scraper.tasks import load_model, update_dataset
+
+# Main function: discover changed project pages, rank the seed pages, crawl the project
+# pages behind them and merge everything into the CSV file, all through the shared pipeline.
+# The model and clients are created here, not at import: parse worker processes re-import
+# this script and must not load BERT again.
+# Set SCRAPER_PROFILE=sampling|deterministic to profile each run, or SCRAPER_PROFILE_EVERY=N to
+# profile 1 in N URLs; results are written to profiles/ tagged by run id
 def main():
-    urls = []
-    with open('input_urls.csv', 'r') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            urls.append(row['Source URL'])
-    
-    # Fetch content, generate summaries, and select top links based on relevance
-    summaries = []
-    for url in urls:
-        print(f"Processing {url}...")
-        content = fetch_content(url)
-        if content:
-            summary = generate_summary(content)
-            if summary:
-                summaries.append((url, summary))
+    # Initialize BERT model and tokenizer
+    tokenizer, model = load_model()
 
-    # Assess relevance of summaries and assign scores
-    scores = []
-    for url, summary in summaries:
-        score = 0
-        # Check for keywords related to construction, infrastructure, projects, tenders, and California
-        if "construction" in summary.lower():
-            score += 1
-        if "infrastructure" in summary.lower():
-            score += 1
-        if "projects" in summary.lower():
-            score += 1
-        if "tenders" in summary.lower():
-            score += 1
-        if "california" in summary.lower():
-            score += 1
-        scores.append((url, score))
+    # Split the cores between inference, parsing and fetching (`python -m scraper tune` saves a measured split)
+    governor = ResourceGovernor.load('resources.json')
+    governor.apply_torch()
 
-    # Sort links based on scores in descending order
-    scores.sort(key=lambda x: x[1], reverse=True)
+    # Initialize relevance engine; page embeddings are cached on disk so unchanged pages
+    # are not re-embedded on the next run
+    relevance_engine = RelevanceEngine(tokenizer, model, cache_path='embedding_cache.npz')
 
-    # Select top 10 links with highest scores
-    top_links = [link[0] for link in scores[:min(10, len(scores))]]
-    # Print top links
-    print("Top 5 to 10 Relevant Links:")
-    for link in top_links:
-        print(link)
-    # Initialize list to store standardized data
-    standardized_data_list = []
+    # Initialize fetch client; host health is saved between runs so hosts that keep
+    # failing are skipped for a cooldown period instead of being retried every day
+    fetch_client = FetchClient(state_path=HOST_STATE_FILE)
 
-    # Iterate over URLs
-    for url in top_links:
-        print("Scraping data from", url)
-        # Step 1: Fetch HTML content
-        html_content = fetch_html_content(url)
-        if html_content:
-            # Step 2: Extract Information
-            title, description, additional_info = extract_information(html_content)
-            if title and description:
-                # Step 3: Standardize Data
-                standardized_data = standardize_data(title, description, additional_info, None, url)
-                # Add standardized data to list
-                standardized_data_list.append(standardized_data)
-                print("Standardized Data:", standardized_data)
-                print()  # Add newline for readability between URLs
-            else:
-                print("Failed to extract information from", url)
-        else:
-            print("Failed to fetch HTML content from", url)
+    # Initialize sitemap/robots discovery; remembers each page's <lastmod> so only
+    # new or modified project pages are queued on the next run
+    discovery = Discovery(fetch_client, state_path=DISCOVERY_STATE_FILE)
 
-    # Write standardized data to CSV file
-    write_to_csv(standardized_data_list, 'standardized_data.csv')
+    url_profiler = UrlProfiler(int(os.environ['SCRAPER_PROFILE_EVERY'])) if os.environ.get('SCRAPER_PROFILE_EVERY') \
+        else None
 
-if __name__ == "__main__":
-    # Run the main function in an infinite loop with a delay of 24 hours (86400 seconds)
+    # Run the update in an infinite loop with a delay of 24 hours (86400 seconds)
     while True:
         print("Running data scraping and standardization process...")
-        main()
+        with profile_run(os.environ.get('SCRAPER_PROFILE')):
+            update_dataset('input_urls.csv', 'standardized_data.csv', fetch_client, relevance_engine, discovery,
+                           governor=governor, url_profiler=url_profiler)
         print("Waiting for next execution...")
         time.sleep(86400)  # Delay for 24 hours (86400 seconds)
+
+if __name__ == "__main__":
+    main()
@@ -1,210 +1,36 @@
-import csv
-import requests
-from bs4 import BeautifulSoup
-from datetime import datetime
-import json
-import uuid
-from transformers import BertTokenizer, BertForSequenceClassification
-import torch
-import random
-
-# Initialize BERT model and tokenizer
-tokenizer = BertTokenizer.from_pretrained('bert-base-uncased')
-model = BertForSequenceClassification.from_pretrained('bert-base-uncased', num_labels=2)
-model.eval()
-
-
-# Function to fetch content from a URL and remove HTML tags
-def fetch_content(url):
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.content, 'html.parser')
-            # Remove HTML tags and extract text
-            text = soup.get_text(separator=' ')
-            return text
-        else:
-            print(f"Failed to fetch URL: {url}")
-            return None
-    except Exception as e:
-        print(f"Error processing URL {url}: {str(e)}")
-        return None
-
-# Function to generate summary using BERT
-def generate_summary(text):
-    try:
-        # Tokenize and truncate the text for BERT input
-        inputs = tokenizer.encode_plus(text, return_tensors="pt", max_length=512, truncation=True)
-        # Generate summary using BERT
-        outputs = model(**inputs)
-        summary = tokenizer.decode(outputs.logits.argmax(dim=-1)[0])
-        return summary
-    except Exception as e:
-        print(f"Error generating summary: {str(e)}")
-        return None
-
-
-# Function to fetch HTML content from a URL
-def fetch_html_content(url):
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            return response.content
-        else:
-            print(f"Failed to fetch HTML content from {url}")
-            return None
-    except Exception as e:
-        print(f"Error fetching HTML content from {url}: {str(e)}")
-        return None
-
-# Function to extract information from HTML content
-def extract_information(html_content):
-    if html_content:
-        try:
-            soup = BeautifulSoup(html_content, 'html.parser')
-            # Extract title
-            title = soup.title.text.strip()
-            # Extract description meta tag
-            description_tag = soup.find('meta', attrs={'name': 'description'})
-            description = description_tag['content'].strip() if description_tag else ""
-            # Extract additional attributes
-            additional_info = {}
-            # You can add code here to extract additional attributes from the HTML content
-            return title, description, additional_info
-        except Exception as e:
-            print(f"Error extracting information: {str(e)}")
-            return None, None, None
-    else:
-        return None, None, None
-
-# Function to analyze HTML content using BERT and extract relevant attributes
-def analyze_with_bert(html_content):
-    # Process the HTML content
-    # For demonstration, let's assume we're analyzing the content for standard attributes using BERT
-    bert_predicted_attributes = {
-        "status": random.choice(["Open", "Closed"]),
-        "stages": random.choice(["Planning", "Execution"]),
-        "procurementMethod": random.choice(["Design and Build", "Request for Proposal"]),
-        "budget": random.uniform(100000.0, 10000000.0),  # Random budget between 100,000 and 10,000,000 USD
-        "currency": "USD",
-        "buyer": random.choice(["Public", "Private"]),
-        "sector": "Construction",
-        "subsector": random.choice(["Building Construction", "Infrastructure Development"])
-    }
-    return bert_predicted_attributes
-
-# Function to standardize data according to Table 2
-def standardize_data(title, description, additional_info, bert_predicted_label, url):
-    aug_id = str(uuid.uuid4())  # Generate UUID
-    country_name = "United States"
-    country_code = "USA"
-    map_coordinates = {"type": "Point", "coordinates": [-122.4, 37.8]}  # Default coordinates for demonstration
-    region_name = "California"
-    region_code = "CA"
-    status = additional_info.get("status", random.choice(["Open", "Closed"]))
-    stages = additional_info.get("stages", random.choice(["Planning", "Execution"]))
-    date = datetime.now().strftime("%Y-%m-%d")  # Current date
-    procurement_method = additional_info.get("procurementMethod", random.choice(["Design and Build", "Request for Proposal"]))
-    budget = additional_info.get("budget", random.uniform(100000.0, 10000000.0))  # Random budget between 100,000 and 10,000,000 USD
-    currency = additional_info.get("currency", "USD")
-    buyer = additional_info.get("buyer", random.choice(["Public", "Private"]))
-    sector = additional_info.get("sector", "Construction")
-    subsector = additional_info.get("subsector", random.choice(["Building Construction", "Infrastructure Development"]))
-
-    # Analyze description with BERT
-    bert_predicted_label = bert_predicted_label or analyze_with_bert(description)
-
-    # Construct standardized data as dictionary
-    standardized_data = {
-        "aug_id": aug_id,
-        "country_name": country_name,
-        "country_code": country_code,
-        "map_coordinates": map_coordinates,
-        "url": url,
-        "region_name": region_name,
-        "region_code": region_code,
-        "title": title,
-        "description": description,
-        "status": status,
-        "stages": stages,
-        "date": date,
-        "procurementMethod": procurement_method,
-        "budget": budget,
-        "currency": currency,
-        "buyer": buyer,
-        "sector": sector,
-        "subsector": subsector,
-        "bert_predicted_label": bert_predicted_label
-    }
-    return standardized_data
-
-
-# Main function
+import os
+import sys
+
+# Make the shared `scraper` package importable when running from the scripts folder
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from scraper.fetch import FetchClient
+from scraper.relevance import RelevanceEngine
+from scraper.resources import ResourceGovernor
+from scraper.standardize import write_to_csv
+from scraper.tasks import load_model, read_cities, read_urls, scrape_top_links
+
+# Main function; the model and clients are created here, not at import, because parse worker
+# processes re-import this script and must not load BERT again
 def main():
-    urls = []
-    with open('input_urls.csv', 'r') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            urls.append(row['Source URL'])
-    
-    # Fetch content, generate summaries, and select top links based on relevance
-    summaries = []
-    for url in urls:
-        print(f"Processing {url}...")
-        content = fetch_content(url)
-        if content:
-            summary = generate_summary(content)
-            if summary:
-                summaries.append((url, summary))
+    # Initialize BERT model and tokenizer
+    tokenizer, model = load_model()
+
+    # Split the cores between inference, parsing and fetching (`python -m scraper tune` saves a measured split)
+    governor = ResourceGovernor.load('resources.json')
+    governor.apply_torch()
 
-    # Assess relevance of summaries and assign scores
-    scores = []
-    for url, summary in summaries:
-        score = 0
-        # Check for keywords related to construction, infrastructure, projects, tenders, and California
-        if "construction" in summary.lower():
-            score += 1
-        if "infrastructure" in summary.lower():
-            score += 1
-        if "projects" in summary.lower():
-            score += 1
-        if "tenders" in summary.lower():
-            score += 1
-        if "california" in summary.lower():
-            score += 1
-        scores.append((url, score))
+    # Initialize relevance engine (query embeddings are computed once here)
+    relevance_engine = RelevanceEngine(tokenizer, model)
 
-    # Sort links based on scores in descending order
-    scores.sort(key=lambda x: x[1], reverse=True)
+    # Initialize fetch client (timeouts, retries with backoff, per-host circuit breaker)
+    fetch_client = FetchClient()
 
-    # Select top 10 links with highest scores
-    top_links = [link[0] for link in scores[:min(10, len(scores))]]
-    # Print top links
-    print("Top 5 to 10 Relevant Links:")
-    for link in top_links:
-        print(link)
-    # Initialize list to store standardized data
-    standardized_data_list = []
+    urls = read_urls('input_urls.csv')
 
-    # Iterate over URLs
-    for url in top_links:
-        print("Scraping data from", url)
-        # Step 1: Fetch HTML content
-        html_content = fetch_html_content(url)
-        if html_content:
-            # Step 2: Extract Information
-            title, description, additional_info = extract_information(html_content)
-            if title and description:
-                # Step 3: Standardize Data
-                standardized_data = standardize_data(title, description, additional_info, None, url)
-                # Add standardized data to list
-                standardized_data_list.append(standardized_data)
-                print("Standardized Data:", standardized_data)
-                print()  # Add newline for readability between URLs
-            else:
-                print("Failed to extract information from", url)
-        else:
-            print("Failed to fetch HTML content from", url)
+    # Fetch, parse and score every page in the shared pipeline, then standardize the top 10 links
+    # (the City column gives each record its coordinates and region)
+    standardized_data_list = scrape_top_links(urls, fetch_client, relevance_engine, top_k=10, governor=governor,
+                                              cities=read_cities('input_urls.csv'))
 
     # Write standardized data to CSV file
     write_to_csv(standardized_data_list, 'standardized_data.csv')
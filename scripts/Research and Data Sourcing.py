@@ -1,11 +1,12 @@
-import requests
-from bs4 import BeautifulSoup
-from transformers import BertTokenizer, BertForSequenceClassification
+import os
+import sys
 
-# Define the BERT model and tokenizer
-model_name = 'bert-base-uncased'
-tokenizer = BertTokenizer.from_pretrained(model_name)
-model = BertForSequenceClassification.from_pretrained(model_name)
+# Make the shared `scraper` package importable when running from the scripts folder
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from scraper.fetch import FetchClient
+from scraper.relevance import RelevanceEngine
+from scraper.resources import ResourceGovernor
+from scraper.tasks import load_model, rank_urls
 
 # URLs of the suggested data sources
 urls = [
@@ -49,69 +50,31 @@ urls = [
     "https://www.shorelinewa.gov/government/projects-initiatives"
 ]
 
-# Function to fetch content from a URL and remove HTML tags
-def fetch_content(url):
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.content, 'html.parser')
-            # Remove HTML tags and extract text
-            text = soup.get_text(separator=' ')
-            return text
-        else:
-            print(f"Failed to fetch URL: {url}")
-            return None
-    except Exception as e:
-        print(f"Error processing URL {url}: {str(e)}")
-        return None
 
-# Function to generate summary using BERT
-def generate_summary(text):
-    try:
-        # Tokenize and truncate the text for BERT input
-        inputs = tokenizer.encode_plus(text, return_tensors="pt", max_length=512, truncation=True)
-        # Generate summary using BERT
-        outputs = model(**inputs)
-        summary = tokenizer.decode(outputs.logits.argmax(dim=-1)[0])
-        return summary
-    except Exception as e:
-        print(f"Error generating summary: {str(e)}")
-        return None
+# Main function
+def main():
+    # Define the BERT model and tokenizer
+    tokenizer, model = load_model()
 
-# Fetch content, generate summaries, and select top links based on relevance
-summaries = []
-for url in urls:
-    print(f"Processing {url}...")
-    content = fetch_content(url)
-    if content:
-        summary = generate_summary(content)
-        if summary:
-            summaries.append((url, summary))
+    # Split the cores between inference, parsing and fetching (`python -m scraper tune` saves a measured split)
+    governor = ResourceGovernor.load('resources.json')
+    governor.apply_torch()
 
-# Assess relevance of summaries and assign scores
-scores = []
-for url, summary in summaries:
-    score = 0
-    # Check for keywords related to construction, infrastructure, projects, tenders, and California
-    if "construction" in summary.lower():
-        score += 1
-    if "infrastructure" in summary.lower():
-        score += 1
-    if "projects" in summary.lower():
-        score += 1
-    if "tenders" in summary.lower():
-        score += 1
-    if "california" in summary.lower():
-        score += 1
-    scores.append((url, score))
+    # Initialize relevance engine (query embeddings are computed once here)
+    relevance_engine = RelevanceEngine(tokenizer, model)
 
-# Sort links based on scores in descending order
-scores.sort(key=lambda x: x[1], reverse=True)
+    # Initialize fetch client (timeouts, retries with backoff, per-host circuit breaker)
+    fetch_client = FetchClient()
 
-# Select top 10 links with highest scores
-top_links = [link[0] for link in scores[:min(10, len(scores))]]
+    # Fetch, parse and score every page in the shared pipeline and select the top 10 links
+    top_pages = rank_urls(urls, fetch_client, relevance_engine, top_k=10, governor=governor)
 
-# Print top links
-print("Top 5 to 10 Relevant Links:")
-for link in top_links:
-    print(link)
+    # Print top links
+    print("Top 5 to 10 Relevant Links:")
+    for page in top_pages:
+        print(page['url'])
+
+
+# Parse workers may run in processes that re-import this script; only start the work when run directly
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import csv
+import multiprocessing
+import os
+import sqlite3
+import time
+
+import pytest
+
+from scraper import distributed
+from scraper.distributed import MAX_ATTEMPTS, SQLiteCoordinator, run_local, run_worker
+
+LEASE_SECONDS = 0.6
+
+
+# Function to make one record per URL, as scrape_shard does
+def records_for(urls):
+    return [{'url': url, 'title': url.rsplit('/', 1)[-1]} for url in urls]
+
+
+# Function to read the URLs of a merged CSV
+def merged_urls(path):
+    with open(path, newline='') as file:
+        return sorted(row['url'] for row in csv.DictReader(file))
+
+
+def test_expired_lease_is_reassigned(tmp_path):
+    coordinator = SQLiteCoordinator(str(tmp_path / 'coordinator.sqlite'))
+    run_id = coordinator.create_run({0: ['https://a.example/1']})
+
+    assert coordinator.lease('dead', LEASE_SECONDS, run_id=run_id)[:2] == (run_id, 0)
+    # Still leased: nobody else gets it
+    assert coordinator.lease('other', LEASE_SECONDS, run_id=run_id) is None
+    time.sleep(LEASE_SECONDS + 0.1)
+    assert coordinator.lease('other', LEASE_SECONDS, run_id=run_id)[:2] == (run_id, 0)
+
+    # The first worker lost the shard: its heartbeat and completion are refused
+    assert not coordinator.heartbeat(run_id, 0, 'dead', LEASE_SECONDS)
+    assert not coordinator.complete(run_id, 0, 'dead', 'dead.csv')
+    assert coordinator.complete(run_id, 0, 'other', 'other.csv')
+    assert coordinator.outputs(run_id) == ['other.csv']
+
+
+def test_latest_run_is_the_last_created(tmp_path):
+    coordinator = SQLiteCoordinator(str(tmp_path / 'coordinator.sqlite'))
+    first = coordinator.create_run({0: ['https://a.example/1']}, run_id='zzz')
+    second = coordinator.create_run({0: ['https://b.example/1']}, run_id='aaa')
+
+    assert coordinator.latest_run() == second
+    # A worker without a run id settles on the latest run and leaves the older one alone
+    completed = run_worker(coordinator, lambda shard, urls: records_for(urls), str(tmp_path / 'parts'),
+                           lease_seconds=LEASE_SECONDS)
+    assert completed == 1
+    assert coordinator.progress(second) == {'done': 1}
+    assert coordinator.progress(first) == {'pending': 1}
+
+
+def test_lost_heartbeat_drops_output(tmp_path):
+    db_path = str(tmp_path / 'coordinator.sqlite')
+    coordinator = SQLiteCoordinator(db_path)
+    run_id = coordinator.create_run({0: ['https://a.example/1']})
+    calls = []
+
+    def scrape_shard(shard, urls):
+        calls.append(shard)
+        if len(calls) == 1:
+            # Another worker takes the shard over while this one is still working on it
+            connection = sqlite3.connect(db_path, isolation_level=None)
+            connection.execute("UPDATE shards SET worker = 'thief' WHERE run_id = ? AND shard = ?", (run_id, shard))
+            connection.close()
+            time.sleep(LEASE_SECONDS)
+        return records_for(urls)
+
+    completed = run_worker(coordinator, scrape_shard, str(tmp_path / 'parts'), worker_id='worker',
+                           lease_seconds=LEASE_SECONDS, run_id=run_id)
+
+    # The first output was dropped; the shard came back once the thief's lease expired
+    assert calls == [0, 0]
+    assert completed == 1
+    assert coordinator.progress(run_id) == {'done': 1}
+    assert len(coordinator.outputs(run_id)) == 1
+
+
+def test_failing_shard_stops_after_max_attempts(tmp_path):
+    coordinator = SQLiteCoordinator(str(tmp_path / 'coordinator.sqlite'))
+    run_id = coordinator.create_run({0: ['https://a.example/1'], 1: ['https://b.example/1']})
+    calls = []
+
+    def scrape_shard(shard, urls):
+        calls.append(shard)
+        if shard == 0:
+            raise RuntimeError('host down')
+        return records_for(urls)
+
+    completed = run_worker(coordinator, scrape_shard, str(tmp_path / 'parts'), lease_seconds=LEASE_SECONDS,
+                           run_id=run_id)
+
+    assert completed == 1
+    assert calls.count(0) == MAX_ATTEMPTS
+    assert coordinator.progress(run_id) == {'done': 1, 'failed': 1}
+
+
+# Stub of make_shard_scraper for the worker processes of run_local. A marker file makes exactly one
+# worker die in the middle of shard 1, and shard 2 always fails.
+def stub_shard_scraper(state_dir, page_cache=None, **options):
+    def scrape_shard(shard, urls):
+        with open(os.path.join(state_dir, 'calls.txt'), 'a') as file:
+            file.write(f"{shard}\n")
+        if shard == 1:
+            try:
+                os.close(os.open(os.path.join(state_dir, 'crashed'), os.O_CREAT | os.O_EXCL))
+            except FileExistsError:
+                pass
+            else:
+                os._exit(1)
+        if shard == 2:
+            raise RuntimeError('host down')
+        return records_for(urls)
+    return scrape_shard
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='needs fork')
+def test_run_local_with_several_workers(tmp_path, monkeypatch):
+    # Forked workers inherit the stub scraper
+    monkeypatch.setattr(distributed, 'multiprocessing', multiprocessing.get_context('fork'))
+    monkeypatch.setattr(distributed, 'make_shard_scraper', stub_shard_scraper)
+    urls = [f"https://host{i}.example/project" for i in range(12)]
+    shards = distributed.make_shards(urls, 4)
+    state_dir = str(tmp_path / 'state')
+    output = str(tmp_path / 'standardized_data.csv')
+
+    count = run_local(str(tmp_path / 'coordinator.sqlite'), urls, output, num_shards=4, num_workers=3,
+                      parts_dir=str(tmp_path / 'parts'), state_dir=state_dir, lease_seconds=LEASE_SECONDS)
+
+    coordinator = SQLiteCoordinator(str(tmp_path / 'coordinator.sqlite'))
+    progress = coordinator.progress(coordinator.latest_run())
+    with open(os.path.join(state_dir, 'calls.txt')) as file:
+        calls = [int(line) for line in file]
+    expected = sorted(url for shard, shard_urls in shards.items() if shard != 2 for url in shard_urls)
+
+    # The crashed worker's shard was picked up by another worker once its lease expired
+    assert os.path.exists(os.path.join(state_dir, 'crashed'))
+    assert calls.count(1) == 2
+    # The failing shard was tried MAX_ATTEMPTS times across the workers, then given up
+    assert calls.count(2) == MAX_ATTEMPTS
+    assert progress == {'done': len(shards) - 1, 'failed': 1}
+    assert count == len(expected)
+    assert merged_urls(output) == expected